@@ -8,34 +8,762 @@ Module to provide ceph control with salt.
 '''
 # Import Python Libs
 from __future__ import absolute_import
+import contextlib
+import copy
+import fcntl
+import functools
+import hashlib
+import importlib
+import inspect
+import json
 import logging
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import uuid
+from multiprocessing.pool import ThreadPool
+try:
+    from importlib.util import find_spec
+except ImportError:
+    # Python 2 has no importlib.util
+    import imp
+    find_spec = None
+
+# Import Salt Libs
+from salt.exceptions import CommandExecutionError
 
 
 log = logging.getLogger(__name__)
 
 __virtualname__ = 'ceph_cfg'
 
-try:
-    import ceph_cfg
-    # Due to a bug in salt
-    # https://github.com/saltstack/salt/issues/35444
-    # we cant rely on previous import to
-    # detect that the library ceph_cfg is present.
-    # Hence we import the version of the library.
-    from ceph_cfg.__version__ import version as ceph_cfg_version
-    HAS_CEPH_CFG = True
-except ImportError:
-    HAS_CEPH_CFG = False
+# Default number of worker threads used by the *_many functions.
+_DEFAULT_MAX_WORKERS = 8
+
+# Partition inventory cache shared by the partition and OSD discovery
+# functions. Results are valid while the block device fingerprint is
+# unchanged.
+_INVENTORY = {'fingerprint': None, 'results': {}, 'loaded': False}
+_INVENTORY_LOCK = threading.RLock()
+_INVENTORY_FILE = 'partition_inventory.json'
+_SYS_BLOCK = '/sys/block'
+_UDEV_DATA = '/run/udev/data'
+_DISK_SKIP = ('loop', 'ram', 'zram', 'dm-', 'md', 'sr', 'fd', 'nbd', 'rbd')
+_DEFAULT_JOURNAL_RATIO = {'ssd': 4, 'nvme': 12}
+_PROC_MOUNTS = '/proc/mounts'
+
+# Cluster status cache shared by the mon and cluster status functions.
+# Results are valid for the "ceph_cfg.status_ttl" option in seconds.
+_STATUS = {}
+_STATUS_LOCK = threading.Lock()
+_DEFAULT_STATUS_TTL = 30
+# Status functions which can be read from the salt mine, published by
+# mine_status on the minions matching the "ceph_cfg.mine_target" option.
+_MINE_FUNCTIONS = ('cluster_status', 'cluster_quorum')
+_DEFAULT_MINE_TARGET = '*'
+# Salt's default "mine_interval" in minutes. The default mine max age is
+# twice the mine interval, so one missed update does not expire the data.
+_DEFAULT_MINE_INTERVAL = 60
+
+# Cephx authorization list cache indexed by entity name. Results are valid
+# for the "ceph_cfg.auth_ttl" option in seconds and dropped when the
+# authorised list is changed through this module.
+_AUTH = {}
+_AUTH_LOCK = threading.Lock()
+_DEFAULT_AUTH_TTL = 30
+
+# Per function call statistics, recorded when the "ceph_cfg.instrument"
+# option is set.
+_STATS = {}
+_STATS_LOCK = threading.Lock()
+# Arguments recorded by value in the call statistics.
+_STATS_DEVICE_ARGS = ('dev', 'osd_dev', 'journal_dev')
+_STATS_CLUSTER_ARGS = ('cluster_name',)
+# Upper bounds in seconds of the call duration histogram buckets.
+_STATS_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300)
+# Last cluster health and quorum results seen by the status functions.
+_STATS_STATUS = {}
+# Call statistics of this process not yet added to the totals on disk,
+# and the number of instrumented calls running in this process.
+_STATS_PENDING = {}
+_STATS_ACTIVE = [0]
+# Public functions which are not instrumented.
+_UNINSTRUMENTED = ('stats', 'metrics_export')
+_METRICS_FILE = 'metrics.json'
+_METRICS_LOCK_FILE = 'metrics.lock'
+_DEFAULT_METRICS_PATH = '/var/lib/node_exporter/textfile_collector/ceph_cfg.prom'
+_METRICS_SCHEDULE = 'ceph_cfg_metrics_export'
+
+# Long running functions which job_start can run in the background.
+_JOB_FUNCTIONS = (
+    'mon_create',
+    'osd_prepare',
+    'osd_activate',
+    'osd_prepare_many',
+    'osd_activate_many',
+    'rgw_create',
+    'mds_create',
+    'zap_many'
+)
+# Seconds to keep the records of finished background jobs.
+_JOB_RETENTION = 86400
+
+# Keyring types and the cephx entity each keyring type authorises.
+_KEYRING_ENTITIES = {
+    'admin': 'client.admin',
+    'mon': 'mon.',
+    'osd': 'client.bootstrap-osd',
+    'rgw': 'client.bootstrap-rgw',
+    'mds': 'client.bootstrap-mds'
+}
+# Keyring types added to the authorised list by keyring_auth_add.
+_KEYRING_AUTH_TYPES = ('osd', 'rgw', 'mds')
+
+# Idle python-rados cluster handles by cluster name and uuid, used for the
+# monitor commands this module runs itself. Each entry is a list of
+# [handle, last used time].
+_RADOS = {}
+_RADOS_LOCK = threading.Lock()
+_DEFAULT_RADOS_POOL_SIZE = 4
+_DEFAULT_RADOS_IDLE = 300
+_DEFAULT_RADOS_TIMEOUT = 10
+# Time of the last failed connect by cluster name and uuid. No new connect
+# is tried for the "ceph_cfg.rados_retry" option in seconds after a failure,
+# so callers waiting for quorum fall back to the library at once.
+_RADOS_FAILED = {}
+_DEFAULT_RADOS_RETRY = 30
+
+# Parsed ceph config files by path. Each entry is the file identity, the
+# mtime, inode and size, the time it was last checked and the parsed
+# sections. Files are checked for changes at most every
+# _CONF_CHECK_INTERVAL seconds.
+_CONF = {}
+_CONF_LOCK = threading.Lock()
+_CONF_CHECK_INTERVAL = 1
+
+
+class _LazyLibrary(object):
+    '''
+    Import a library on first attribute access
+
+    Keeps the cost of importing the ceph_cfg library off the loading of
+    this module, which happens on every minion.
+    '''
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+ceph_cfg = _LazyLibrary('ceph_cfg')
+rados = _LazyLibrary('rados')
+
+
+def _library_available(name):
+    '''
+    Utility function: Find the ceph_cfg library without importing it
+
+    Due to a bug in salt
+    https://github.com/saltstack/salt/issues/35444
+    we cant rely on finding a module called ceph_cfg to
+    detect that the library ceph_cfg is present.
+    Hence we look for the version file of the library.
+    '''
+    if find_spec is None:
+        try:
+            locations = [imp.find_module(name)[1]]
+        except ImportError:
+            return False
+    else:
+        try:
+            spec = find_spec(name)
+        except (ImportError, ValueError):
+            return False
+        if spec is None or not spec.submodule_search_locations:
+            return False
+        locations = list(spec.submodule_search_locations)
+    for location in locations:
+        if os.path.isfile(os.path.join(location, '__version__.py')):
+            return True
+    return False
 
 
 def __virtual__():
-    if HAS_CEPH_CFG is False:
+    if not _library_available('ceph_cfg'):
         msg = 'ceph_cfg unavailable: {0} execution module cant be loaded '.format(__virtualname__)
         return False, msg
     return __virtualname__
 
 
-def partition_list():
+def _max_workers(max_workers):
+    '''
+    Utility function: Validate the size of a worker pool
+    '''
+    if max_workers is None:
+        return _DEFAULT_MAX_WORKERS
+    try:
+        max_workers = int(max_workers)
+    except (TypeError, ValueError):
+        raise CommandExecutionError("Invalid max_workers:{0}".format(max_workers))
+    if max_workers < 1:
+        raise CommandExecutionError("Invalid max_workers:{0}".format(max_workers))
+    return max_workers
+
+
+def _item_specs(items, key, noun, **kwargs):
+    '''
+    Utility function: Normalise a list of items into per item arguments
+
+    Each entry of items is either the value of key, such as a device path
+    or pool name, or a dictionary of arguments for that item. Per item
+    arguments override the shared kwargs. noun names the items in errors.
+    '''
+    if not isinstance(items, (list, tuple)):
+        raise CommandExecutionError("Invalid {0} list:{1}".format(noun, items))
+    specs = []
+    seen = set()
+    for item in items:
+        params = dict(kwargs)
+        if isinstance(item, dict):
+            params.update(item)
+        else:
+            params[key] = item
+        value = params.get(key)
+        if not value:
+            raise CommandExecutionError("Missing {0} in:{1}".format(key, item))
+        if value in seen:
+            raise CommandExecutionError("Duplicate {0}:{1}".format(noun, value))
+        seen.add(value)
+        specs.append(params)
+    return specs
+
+
+def _timed_call(func, item):
+    '''
+    Utility function: Call func with item and time it
+
+    Returns a result dictionary, exceptions are reported in the comment.
+    '''
+    start = time.time()
+    try:
+        output = func(item)
+    except Exception as err:  # pylint: disable=broad-except
+        log.error("Batch item {0} failed:{1}".format(item, err))
+        return {
+            'result': False,
+            'comment': str(err),
+            'duration': round(time.time() - start, 3)
+        }
+    return {
+        'result': True,
+        'return': output,
+        'duration': round(time.time() - start, 3)
+    }
+
+
+def _run_many(func, items, max_workers=None, group_key=None):
+    '''
+    Utility function: Run func for every item in a bounded thread pool
+
+    Items sharing the same group_key value are run serially within one
+    worker, all other items run concurrently. A failing item never aborts
+    the rest of the batch.
+
+    Returns a list of result dictionaries in the same order as items.
+    '''
+    def _run_group(indexes):
+        return [(index, _timed_call(func, items[index])) for index in indexes]
+
+    groups = []
+    group_index = {}
+    for index, item in enumerate(items):
+        if group_key is None:
+            groups.append([index])
+            continue
+        key = group_key(item)
+        if key not in group_index:
+            group_index[key] = len(groups)
+            groups.append([])
+        groups[group_index[key]].append(index)
+    workers = min(_max_workers(max_workers), len(groups))
+    if workers <= 1:
+        group_results = [_run_group(group) for group in groups]
+    else:
+        pool = ThreadPool(workers)
+        try:
+            group_results = pool.map(_run_group, groups)
+        finally:
+            pool.close()
+            pool.join()
+    results = [None] * len(items)
+    for group_result in group_results:
+        for index, result in group_result:
+            results[index] = result
+    return results
+
+
+def _option(name, default=None):
+    '''
+    Utility function: Get a module option from config, grains or pillar
+    '''
+    key = '{0}.{1}'.format(__virtualname__, name)
+    if 'config.get' in __salt__:
+        return __salt__['config.get'](key, default)
+    return __opts__.get(key, default)
+
+
+def _conf_parse(conf_file):
+    '''
+    Utility function: Parse a ceph config file
+
+    Returns a dictionary of sections, each a dictionary of values by key.
+    Keys are normalised as ceph does, so "mon host" and "mon_host" match.
+    '''
+    sections = {}
+    section = sections.setdefault('global', {})
+    for line in conf_file:
+        line = line.strip()
+        if not line or line[0] in '#;':
+            continue
+        if line.startswith('[') and line.endswith(']'):
+            section = sections.setdefault(line[1:-1].strip(), {})
+            continue
+        if '=' not in line:
+            continue
+        key, value = line.split('=', 1)
+        value = re.split(r'\s[#;]', value, 1)[0].strip()
+        section['_'.join(key.strip().lower().replace('_', ' ').split())] = value
+    return sections
+
+
+def _conf_read(path):
+    '''
+    Utility function: Get a parsed ceph config file
+
+    Files are parsed once and again only when their mtime, inode or size
+    change, which is checked at most every _CONF_CHECK_INTERVAL seconds.
+    Returns None if the file is missing.
+    '''
+    with _CONF_LOCK:
+        cached = _CONF.get(path)
+        if cached is not None and time.time() - cached[1] < _CONF_CHECK_INTERVAL:
+            return cached[2]
+    try:
+        stat = os.stat(path)
+    except OSError:
+        with _CONF_LOCK:
+            _CONF.pop(path, None)
+        return None
+    identity = (stat.st_mtime, stat.st_ino, stat.st_size)
+    if cached is not None and cached[0] == identity:
+        with _CONF_LOCK:
+            _CONF[path] = (identity, time.time(), cached[2])
+        return cached[2]
+    try:
+        with open(path) as conf_file:
+            sections = _conf_parse(conf_file)
+    except (IOError, OSError) as err:
+        log.debug("Failed reading {0}:{1}".format(path, err))
+        return None
+    with _CONF_LOCK:
+        _CONF[path] = (identity, time.time(), sections)
+    return sections
+
+
+def _conf_value(key, section='global', cluster_name=None):
+    '''
+    Utility function: Get a value from the ceph config file of a cluster
+
+    Like ceph, a key missing in a daemon section such as "osd.0" is looked
+    up in the "osd" section and then in "global". Returns None if not set.
+    '''
+    sections = _conf_read('/etc/ceph/{0}.conf'.format(cluster_name or 'ceph'))
+    if sections is None:
+        return None
+    key = '_'.join(key.lower().replace('_', ' ').split())
+    for name in [section, section.split('.')[0], 'global']:
+        if key in sections.get(name, {}):
+            return sections[name][key]
+    return None
+
+
+def _cluster_key(cluster_name=None, cluster_uuid=None):
+    '''
+    Utility function: Identify a cluster by name and uuid
+
+    A missing cluster_uuid is taken from the fsid in the ceph config file,
+    so callers passing it and callers relying on the default share cache
+    entries.
+    '''
+    return (cluster_name or 'ceph', cluster_uuid or _conf_value('fsid', cluster_name=cluster_name))
+
+
+def _cluster_args(kwargs):
+    '''
+    Utility function: Add the cluster uuid from the cached config to kwargs
+
+    Passing cluster_uuid to the library saves it reading the config file
+    for the fsid. Returns kwargs unchanged if cluster_uuid is set or the
+    config has no fsid.
+    '''
+    if kwargs.get('cluster_uuid') is not None:
+        return kwargs
+    cluster_uuid = _conf_value('fsid', cluster_name=kwargs.get('cluster_name'))
+    if cluster_uuid is None:
+        return kwargs
+    return dict(kwargs, cluster_uuid=cluster_uuid)
+
+
+def _stats_record(name, args, kwargs, duration, error):
+    '''
+    Utility function: Record one call in the call statistics
+    '''
+    shape = ','.join(['*{0}'.format(len(args))] + sorted(kwargs)) if args else ','.join(sorted(kwargs))
+    with _STATS_LOCK:
+        entry = _STATS.setdefault(name, {
+            'calls': 0,
+            'errors': 0,
+            'time_total': 0.0,
+            'time_max': 0.0,
+            'buckets': [0] * len(_STATS_BUCKETS),
+            'shapes': {},
+            'devices': {},
+            'clusters': {}
+        })
+        entry['calls'] += 1
+        if error:
+            entry['errors'] += 1
+        entry['time_total'] += duration
+        entry['time_max'] = max(entry['time_max'], duration)
+        pending = _STATS_PENDING.setdefault(name, {
+            'calls': 0,
+            'errors': 0,
+            'time_total': 0.0,
+            'buckets': [0] * len(_STATS_BUCKETS)
+        })
+        pending['calls'] += 1
+        if error:
+            pending['errors'] += 1
+        pending['time_total'] += duration
+        for index, bound in enumerate(_STATS_BUCKETS):
+            if duration <= bound:
+                entry['buckets'][index] += 1
+                pending['buckets'][index] += 1
+                break
+        entry['shapes'][shape] = entry['shapes'].get(shape, 0) + 1
+        for arg_names, counts in [(_STATS_DEVICE_ARGS, entry['devices']),
+                                  (_STATS_CLUSTER_ARGS, entry['clusters'])]:
+            for arg_name in arg_names:
+                value = kwargs.get(arg_name)
+                if value is None or isinstance(value, (list, tuple, dict)):
+                    continue
+                counts[str(value)] = counts.get(str(value), 0) + 1
+
+
+def _instrument(func):
+    '''
+    Utility function: Wrap a public function to record call statistics
+
+    Statistics are only recorded when the "ceph_cfg.instrument" option is
+    set, and added to the totals on disk when no other instrumented call
+    is running in this process. Calls slower than the
+    "ceph_cfg.slow_call_threshold" option in seconds fire a
+    "ceph_cfg/slow_call" event.
+    '''
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        for key in [key for key in kwargs if key.startswith('__pub_')]:
+            del kwargs[key]
+        if not _option('instrument', False):
+            return func(*args, **kwargs)
+        with _STATS_LOCK:
+            _STATS_ACTIVE[0] += 1
+        start = time.time()
+        error = True
+        try:
+            output = func(*args, **kwargs)
+            error = False
+            return output
+        finally:
+            duration = time.time() - start
+            _stats_record(func.__name__, args, kwargs, duration, error)
+            with _STATS_LOCK:
+                _STATS_ACTIVE[0] -= 1
+                outermost = _STATS_ACTIVE[0] == 0
+            if outermost:
+                _metrics_flush()
+            threshold = _option('slow_call_threshold', None)
+            if threshold is not None and duration > float(threshold) and 'event.send' in __salt__:
+                __salt__['event.send']('ceph_cfg/slow_call', {
+                    'function': func.__name__,
+                    'duration': round(duration, 3),
+                    'error': error,
+                    'kwargs': dict((key, kwargs[key]) for key in kwargs
+                                   if key in _STATS_DEVICE_ARGS + _STATS_CLUSTER_ARGS)
+                })
+    return wrapper
+
+
+def _instrument_module():
+    '''
+    Utility function: Instrument every public function of this module
+    '''
+    module_globals = globals()
+    for name, func in list(module_globals.items()):
+        if name.startswith('_') or name in _UNINSTRUMENTED:
+            continue
+        if not inspect.isfunction(func) or func.__module__ != __name__:
+            continue
+        module_globals[name] = _instrument(func)
+
+
+def _stats_status(name, kwargs, output):
+    '''
+    Utility function: Record the last cluster health and quorum results
+    '''
+    if name == 'cluster_status':
+        health = output.get('health', {}) if isinstance(output, dict) else {}
+        value = health.get('status', health.get('overall_status'))
+    else:
+        value = bool(output)
+    key = json.dumps([name, kwargs.get('cluster_name') or 'ceph', kwargs.get('mon_name')])
+    with _STATS_LOCK:
+        _STATS_STATUS[key] = {'value': value, 'timestamp': time.time()}
+
+
+def _status_query(name, loader, kwargs):
+    '''
+    Utility function: Get a cluster status result
+
+    Results are shared between callers for "ceph_cfg.status_ttl" seconds,
+    and read from the salt mine when "ceph_cfg.status_source" is "mine".
+    Results read from the mine are shared the same way. Passing
+    refresh=True in kwargs always queries the cluster.
+    '''
+    refresh = kwargs.pop('refresh', False)
+    ttl = float(_option('status_ttl', _DEFAULT_STATUS_TTL))
+    key = json.dumps([name, _cluster_key(kwargs.get('cluster_name'), kwargs.get('cluster_uuid')),
+                      kwargs.get('mon_name')])
+    with _STATUS_LOCK:
+        cached = _STATUS.get(key)
+    if not refresh and cached is not None and time.time() - cached[0] <= ttl:
+        return copy.deepcopy(cached[1])
+    published = None if refresh else _mine_query(name, kwargs)
+    output = loader(**kwargs) if published is None else published[name]
+    with _STATUS_LOCK:
+        _STATUS[key] = (time.time(), output)
+    if name in ('cluster_status', 'cluster_quorum', 'mon_quorum'):
+        _stats_status(name, kwargs, output)
+    return copy.deepcopy(output)
+
+
+def _mine_query(name, kwargs):
+    '''
+    Utility function: Get status published to the salt mine by mine_status
+
+    Only used when the "ceph_cfg.status_source" option is "mine". The
+    freshest entry for the cluster published by the minions matching the
+    "ceph_cfg.mine_target" option is used if it is not older than the
+    "ceph_cfg.mine_max_age" option in seconds, defaulting to twice the
+    "mine_interval" minion option. Returns None otherwise.
+    '''
+    if name not in _MINE_FUNCTIONS or _option('status_source', 'cluster') != 'mine':
+        return None
+    try:
+        published = __salt__['mine.get'](
+            _option('mine_target', _DEFAULT_MINE_TARGET),
+            '{0}.mine_status'.format(__virtualname__),
+            tgt_type=_option('mine_target_type', 'glob'))
+    except Exception as err:  # pylint: disable=broad-except
+        log.debug("Failed reading the salt mine:{0}".format(err))
+        return None
+    cluster = list(_cluster_key(kwargs.get('cluster_name'), kwargs.get('cluster_uuid')))
+    max_age = _option('mine_max_age', None)
+    if max_age is None:
+        max_age = 2 * 60 * __opts__.get('mine_interval', _DEFAULT_MINE_INTERVAL)
+    max_age = float(max_age)
+    freshest = None
+    for data in (published or {}).values():
+        if not isinstance(data, dict) or name not in data or data.get('cluster') != cluster:
+            continue
+        if time.time() - data.get('timestamp', 0) > max_age:
+            continue
+        if freshest is None or data['timestamp'] > freshest['timestamp']:
+            freshest = data
+    return freshest
+
+
+def _status_invalidate():
+    '''
+    Utility function: Drop cached cluster status after mon changes
+    '''
+    with _STATUS_LOCK:
+        _STATUS.clear()
+
+
+def _read_sysfs(path):
+    '''
+    Utility function: Read a sysfs attribute, None if not present
+    '''
+    try:
+        with open(path) as sysfs_file:
+            return sysfs_file.read().strip()
+    except (IOError, OSError):
+        return None
+
+
+def _mtime(path):
+    '''
+    Utility function: Get the modification time of a path, None if missing
+    '''
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def _inventory_fingerprint():
+    '''
+    Utility function: Fingerprint the block devices of this node
+
+    Uses the device numbers, sizes and partitions from sysfs, and the udev
+    database entries which udev rewrites on every change event.
+    '''
+    try:
+        names = sorted(os.listdir(_SYS_BLOCK))
+    except OSError:
+        return None
+    entries = []
+    for name in names:
+        block_path = os.path.join(_SYS_BLOCK, name)
+        try:
+            partitions = sorted(part for part in os.listdir(block_path) if part.startswith(name))
+        except OSError:
+            partitions = []
+        for part_name, part_path in [(name, block_path)] + [
+                (part, os.path.join(block_path, part)) for part in partitions]:
+            dev_t = _read_sysfs(os.path.join(part_path, 'dev'))
+            entries.append([
+                part_name,
+                dev_t,
+                _read_sysfs(os.path.join(part_path, 'size')),
+                _mtime(os.path.join(_UDEV_DATA, 'b{0}'.format(dev_t)))
+            ])
+    return hashlib.sha1(json.dumps(entries).encode('utf-8')).hexdigest()
+
+
+def _inventory_path():
+    '''
+    Utility function: Path of the on disk partition inventory snapshot
+    '''
+    cachedir = __opts__.get('cachedir')
+    if not cachedir:
+        return None
+    return os.path.join(cachedir, 'ceph_cfg', _INVENTORY_FILE)
+
+
+def _write_atomic(path, content, mode=None):
+    '''
+    Utility function: Replace a file atomically
+    '''
+    dirname = os.path.dirname(path)
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    handle, tmp_path = tempfile.mkstemp(dir=dirname, prefix='.tmp')
+    try:
+        with os.fdopen(handle, 'w') as tmp_file:
+            tmp_file.write(content)
+        if mode is not None:
+            os.chmod(tmp_path, mode)
+        os.rename(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+
+def _inventory_load():
+    '''
+    Utility function: Load the on disk snapshot once per process
+    '''
+    if _INVENTORY['loaded']:
+        return
+    _INVENTORY['loaded'] = True
+    path = _inventory_path()
+    if path is None or not os.path.isfile(path):
+        return
+    try:
+        with open(path) as snapshot_file:
+            snapshot = json.load(snapshot_file)
+        _INVENTORY['fingerprint'] = snapshot['fingerprint']
+        _INVENTORY['results'] = snapshot['results']
+    except (IOError, OSError, ValueError, KeyError) as err:
+        log.debug("Ignoring partition inventory snapshot {0}:{1}".format(path, err))
+
+
+def _inventory_save():
+    '''
+    Utility function: Write the on disk snapshot
+    '''
+    path = _inventory_path()
+    if path is None:
+        return
+    try:
+        content = json.dumps({
+            'fingerprint': _INVENTORY['fingerprint'],
+            'results': _INVENTORY['results']
+        })
+        _write_atomic(path, content)
+    except (IOError, OSError, TypeError, ValueError) as err:
+        log.debug("Failed saving partition inventory snapshot {0}:{1}".format(path, err))
+
+
+def _inventory_query(key, loader, max_age=None):
+    '''
+    Utility function: Get a partition inventory result
+
+    The cached result is used while the block devices are unchanged and the
+    result is not older than max_age seconds, otherwise loader is called.
+    '''
+    with _INVENTORY_LOCK:
+        _inventory_load()
+        fingerprint = _inventory_fingerprint()
+        if fingerprint is None or fingerprint != _INVENTORY['fingerprint']:
+            _INVENTORY['fingerprint'] = fingerprint
+            _INVENTORY['results'] = {}
+        cached = _INVENTORY['results'].get(key)
+        if cached is not None and fingerprint is not None:
+            if max_age is None or time.time() - cached[0] <= float(max_age):
+                return copy.deepcopy(cached[1])
+        output = loader()
+        _INVENTORY['results'][key] = [time.time(), output]
+        _inventory_save()
+        return copy.deepcopy(output)
+
+
+def _inventory_invalidate():
+    '''
+    Utility function: Drop the partition inventory after disk changes
+    '''
+    with _INVENTORY_LOCK:
+        _INVENTORY['loaded'] = True
+        _INVENTORY['fingerprint'] = None
+        _INVENTORY['results'] = {}
+        path = _inventory_path()
+        if path is not None and os.path.isfile(path):
+            try:
+                os.remove(path)
+            except OSError as err:
+                log.debug("Failed removing partition inventory snapshot {0}:{1}".format(path, err))
+
+
+def partition_list(max_age=None):
     '''
     List partitions by disk
 
@@ -44,11 +772,17 @@ def partition_list():
     .. code-block:: bash
 
         salt '*' ceph_cfg.partition_list
+
+    Notes:
+
+    max_age
+        Maximum age in seconds of a cached result. By default cached
+        results are used until a block device changes.
     '''
-    return ceph_cfg.partition_list()
+    return _inventory_query('partition_list', ceph_cfg.partition_list, max_age)
 
 
-def partition_list_osd():
+def partition_list_osd(max_age=None):
     '''
     List all OSD data partitions by partition
 
@@ -57,11 +791,17 @@ def partition_list_osd():
     .. code-block:: bash
 
         salt '*' ceph_cfg.partition_list_osd
+
+    Notes:
+
+    max_age
+        Maximum age in seconds of a cached result. By default cached
+        results are used until a block device changes.
     '''
-    return ceph_cfg.partition_list_osd()
+    return _inventory_query('partition_list_osd', ceph_cfg.partition_list_osd, max_age)
 
 
-def partition_list_journal():
+def partition_list_journal(max_age=None):
     '''
     List all OSD journal partitions by partition
 
@@ -70,11 +810,17 @@ def partition_list_journal():
     .. code-block:: bash
 
         salt '*' ceph_cfg.partition_list_journal
+
+    Notes:
+
+    max_age
+        Maximum age in seconds of a cached result. By default cached
+        results are used until a block device changes.
     '''
-    return ceph_cfg.partition_list_journal()
+    return _inventory_query('partition_list_journal', ceph_cfg.partition_list_journal, max_age)
 
 
-def osd_discover():
+def osd_discover(max_age=None):
     '''
     List all OSD by cluster
 
@@ -84,11 +830,16 @@ def osd_discover():
 
         salt '*' ceph_cfg.osd_discover
 
+    Notes:
+
+    max_age
+        Maximum age in seconds of a cached result. By default cached
+        results are used until a block device changes.
     '''
-    return ceph_cfg.osd_discover()
+    return _inventory_query('osd_discover', ceph_cfg.osd_discover, max_age)
 
 
-def partition_is(dev):
+def partition_is(dev, max_age=None):
     '''
     Check whether a given device path is a partition or a full disk.
 
@@ -98,8 +849,407 @@ def partition_is(dev):
 
     salt '*' ceph_cfg.partition_is /dev/sdc1
 
+    Notes:
+
+    max_age
+        Maximum age in seconds of a cached result. By default cached
+        results are used until a block device changes.
+    '''
+    def _loader():
+        return ceph_cfg.partition_is(dev)
+    return _inventory_query('partition_is:{0}'.format(dev), _loader, max_age)
+
+
+def _listed_devices(listing):
+    '''
+    Utility function: Get the device paths from a partition listing
+
+    Listings are either by partition, or by disk with a list of partitions.
+    '''
+    devices = []
+    if isinstance(listing, dict):
+        for key, value in listing.items():
+            if isinstance(value, (list, tuple)):
+                devices.extend(_listed_devices(value))
+            else:
+                devices.append(key)
+    elif isinstance(listing, (list, tuple)):
+        for item in listing:
+            if isinstance(item, dict):
+                if item.get('dev'):
+                    devices.append(item['dev'])
+            else:
+                devices.append(item)
+    return devices
+
+
+def _partition_parent(part):
+    '''
+    Utility function: Get the disk a partition is on
+
+    Uses sysfs and falls back to removing the partition number.
+    '''
+    name = os.path.basename(part)
+    sys_path = os.path.join('/sys/class/block', name)
+    if os.path.isfile(os.path.join(sys_path, 'partition')):
+        return os.path.join('/dev', os.path.basename(os.path.dirname(os.path.realpath(sys_path))))
+    match = re.match(r'^(.*\d)p\d+$', part) or re.match(r'^(.*?)\d+$', part)
+    if match is None:
+        return part
+    return match.group(1)
+
+
+def _partition_index(max_age=None):
+    '''
+    Utility function: Build a device index from one inventory scan
+
+    Returns a dictionary by device path with whether the device is a
+    partition and its role, one of "osd", "journal" or "other".
     '''
-    return ceph_cfg.partition_is(dev)
+    index = {}
+    listing = partition_list(max_age=max_age)
+    if isinstance(listing, dict):
+        for disk, partitions in listing.items():
+            index[disk] = {'partition': False, 'role': 'other'}
+            for part in _listed_devices(partitions):
+                index[part] = {'partition': True, 'role': 'other'}
+    for role, devices in [
+            ('journal', _listed_devices(partition_list_journal(max_age=max_age))),
+            ('osd', _listed_devices(partition_list_osd(max_age=max_age)))]:
+        for dev in devices:
+            index.setdefault(dev, {'partition': True})['role'] = role
+    discovered = osd_discover(max_age=max_age)
+    if isinstance(discovered, dict):
+        for osds in discovered.values():
+            for osd in osds if isinstance(osds, (list, tuple)) else []:
+                for key, role in [('dev_journal', 'journal'), ('dev', 'osd')]:
+                    if osd.get(key):
+                        index.setdefault(osd[key], {'partition': True})['role'] = role
+    return index
+
+
+def partition_is_many(devs=None, max_age=None):
+    '''
+    Check whether many device paths are partitions and classify their role.
+
+    CLI Example:
+
+    .. code-block:: bash
+
+        salt '*' ceph_cfg.partition_is_many 'devs'='["/dev/sdc", "/dev/sdc1"]'
+
+    Notes:
+
+    devs
+        Required paramter
+        List of device paths to check.
+
+    max_age
+        Maximum age in seconds of the cached inventory. By default cached
+        results are used until a block device changes.
+
+    Returns a dictionary by device path with "partition" set to whether the
+    device is a partition, and "role" set to one of "osd", "journal",
+    "other" or "unknown" for devices not found on this node. All devices
+    are answered from a single inventory scan.
+    '''
+    if not isinstance(devs, (list, tuple)):
+        raise CommandExecutionError("Invalid devs:{0}".format(devs))
+    index = _partition_index(max_age=max_age)
+    unknown = {'partition': None, 'role': 'unknown'}
+    return dict((dev, dict(index.get(dev, unknown))) for dev in devs)
+
+
+def partition_inventory_refresh():
+    '''
+    Rescan all block devices and refresh the partition inventory cache
+
+    CLI Example:
+
+    .. code-block:: bash
+
+        salt '*' ceph_cfg.partition_inventory_refresh
+
+    Notes:
+
+    Returns the refreshed partition_list, partition_list_osd,
+    partition_list_journal and osd_discover results.
+    '''
+    _inventory_invalidate()
+    return {
+        'partition_list': partition_list(),
+        'partition_list_osd': partition_list_osd(),
+        'partition_list_journal': partition_list_journal(),
+        'osd_discover': osd_discover()
+    }
+
+
+def _udev_properties(dev_t):
+    '''
+    Utility function: Read the udev database properties of a block device
+    '''
+    properties = {}
+    try:
+        with open(os.path.join(_UDEV_DATA, 'b{0}'.format(dev_t))) as udev_file:
+            for line in udev_file:
+                if line.startswith('E:') and '=' in line:
+                    key, value = line[2:].strip().split('=', 1)
+                    properties[key] = value
+    except (IOError, OSError):
+        pass
+    return properties
+
+
+def _numa_node(block_path):
+    '''
+    Utility function: Get the NUMA node of a block device, None if unknown
+
+    The node is read from the nearest parent device in sysfs reporting one.
+    '''
+    path = os.path.realpath(os.path.join(block_path, 'device'))
+    while path.startswith('/sys/devices/'):
+        node = _read_sysfs(os.path.join(path, 'numa_node'))
+        if node is not None:
+            try:
+                node = int(node)
+            except ValueError:
+                return None
+            return node if node >= 0 else None
+        path = os.path.dirname(path)
+    return None
+
+
+def _disk_scan():
+    '''
+    Utility function: Read the disks of this node from sysfs and udev
+    '''
+    try:
+        names = sorted(os.listdir(_SYS_BLOCK))
+    except OSError:
+        return {}
+    disks = {}
+    for name in names:
+        if name.startswith(_DISK_SKIP):
+            continue
+        block_path = os.path.join(_SYS_BLOCK, name)
+        dev_t = _read_sysfs(os.path.join(block_path, 'dev'))
+        udev = _udev_properties(dev_t)
+        try:
+            partitions = sorted(part for part in os.listdir(block_path) if part.startswith(name))
+        except OSError:
+            partitions = []
+        size = _read_sysfs(os.path.join(block_path, 'size'))
+        disks[os.path.join('/dev', name)] = {
+            'rotational': _read_sysfs(os.path.join(block_path, 'queue', 'rotational')) == '1',
+            'nvme': name.startswith('nvme'),
+            'size': int(size) * 512 if size and size.isdigit() else None,
+            'model': _read_sysfs(os.path.join(block_path, 'device', 'model')) or udev.get('ID_MODEL'),
+            'serial': (_read_sysfs(os.path.join(block_path, 'device', 'serial')) or
+                       udev.get('ID_SERIAL_SHORT') or udev.get('ID_SERIAL')),
+            'numa_node': _numa_node(block_path),
+            'partitions': [os.path.join('/dev', part) for part in partitions]
+        }
+    return disks
+
+
+def _journal_candidates(exclude, ssd_ratio=None, nvme_ratio=None, max_age=None):
+    '''
+    Utility function: List the disks usable for journals with their load
+
+    Non rotational disks not in exclude qualify if all their partitions
+    are journals. Returns a dictionary by disk path with the "ratio" of
+    journals allowed, the "existing" journals and "assigned" set to 0.
+    '''
+    ratios = {
+        'ssd': int(ssd_ratio or _option('journal_ratio_ssd', _DEFAULT_JOURNAL_RATIO['ssd'])),
+        'nvme': int(nvme_ratio or _option('journal_ratio_nvme', _DEFAULT_JOURNAL_RATIO['nvme']))
+    }
+    index = _partition_index(max_age=max_age)
+    journals = {}
+    for dev, disk in sorted(disk_inventory(max_age=max_age).items()):
+        if disk['rotational'] or dev in exclude:
+            continue
+        roles = [index.get(part, {}).get('role', 'other') for part in disk['partitions']]
+        if any(role != 'journal' for role in roles):
+            continue
+        journals[dev] = {
+            'ratio': ratios['nvme' if disk['nvme'] else 'ssd'],
+            'existing': len(roles),
+            'assigned': 0
+        }
+    return journals
+
+
+def _journal_auto(specs, max_journals=None, max_age=None):
+    '''
+    Utility function: Resolve journal_dev "auto" in osd_prepare arguments
+
+    Each device gets the journal disk with the fewest journals which is
+    below max_journals, defaulting to the per type journal ratios.
+    Returns the arguments with journal_dev set.
+    '''
+    if not any(params.get('journal_dev') == 'auto' for params in specs):
+        return specs
+    journals = _journal_candidates([params['osd_dev'] for params in specs], max_age=max_age)
+    resolved = []
+    for params in specs:
+        params = dict(params)
+        if params.get('journal_dev') == 'auto':
+            candidates = []
+            for journal, load in journals.items():
+                count = load['existing'] + load['assigned']
+                if count < int(max_journals or load['ratio']):
+                    candidates.append((count, journal))
+            if not candidates:
+                raise CommandExecutionError("No journal device available for:{0}".format(params['osd_dev']))
+            params['journal_dev'] = min(candidates)[1]
+            journals[params['journal_dev']]['assigned'] += 1
+        resolved.append(params)
+    return resolved
+
+
+def disk_inventory(max_age=None):
+    '''
+    List the disks of this node with their metadata
+
+    CLI Example:
+
+    .. code-block:: bash
+
+        salt '*' ceph_cfg.disk_inventory
+
+    Notes:
+    Read from sysfs and the udev database, and cached with the partition
+    inventory.
+
+    max_age
+        Maximum age in seconds of a cached result. By default cached
+        results are used until a block device changes.
+
+    Returns a dictionary by disk path with "rotational", "nvme", "size" in
+    bytes, "model", "serial", "numa_node" and the "partitions" of the disk.
+    Values not known are None.
+    '''
+    return _inventory_query('disk_inventory', _disk_scan, max_age)
+
+
+def osd_layout_suggest(devices=None, ssd_ratio=None, nvme_ratio=None, max_age=None):
+    '''
+    Suggest which journal device to use for each data disk
+
+    CLI Example:
+
+    .. code-block:: bash
+
+        salt '*' ceph_cfg.osd_layout_suggest 'ssd_ratio'='4' 'nvme_ratio'='12'
+
+    Notes:
+    Data disks are given journals on non rotational disks, up to a number
+    of journals per journal disk given by its bandwidth ratio. Each data
+    disk gets the least loaded journal disk, preferring journal disks on
+    the same NUMA node. Journals already on a journal disk count against
+    its ratio. Non rotational disks holding partitions other than journals
+    are not used.
+
+    devices
+        List of data disks. Defaults to all rotational disks without
+        partitions.
+
+    ssd_ratio
+        Data disks per SSD journal disk. Defaults to the option
+        ceph_cfg.journal_ratio_ssd or 4.
+
+    nvme_ratio
+        Data disks per NVMe journal disk. Defaults to the option
+        ceph_cfg.journal_ratio_nvme or 12.
+
+    max_age
+        Maximum age in seconds of the cached inventory. By default cached
+        results are used until a block device changes.
+
+    Returns a dictionary with "osds", a list of "osd_dev" and "journal_dev"
+    usable as devices for osd_prepare_many, where "journal_dev" is None if
+    no journal disk has room, and "journals" by journal disk with its
+    "ratio", "existing" and "assigned" journals.
+    '''
+    disks = disk_inventory(max_age=max_age)
+    if devices is None:
+        devices = [dev for dev, disk in sorted(disks.items()) if disk['rotational'] and not disk['partitions']]
+    journals = _journal_candidates(devices, ssd_ratio, nvme_ratio, max_age)
+    osds = []
+    for dev in devices:
+        node = disks.get(dev, {}).get('numa_node')
+        candidates = [
+            (disks[journal]['numa_node'] != node, float(load['existing'] + load['assigned']) / load['ratio'], journal)
+            for journal, load in journals.items()
+            if load['existing'] + load['assigned'] < load['ratio']]
+        journal_dev = min(candidates)[2] if candidates else None
+        if journal_dev is not None:
+            journals[journal_dev]['assigned'] += 1
+        osds.append({'osd_dev': dev, 'journal_dev': journal_dev})
+    return {'osds': osds, 'journals': journals}
+
+
+def _mounted_devices():
+    '''
+    Utility function: List the mounted device paths of this node
+    '''
+    mounted = set()
+    try:
+        with open(_PROC_MOUNTS) as mounts_file:
+            for line in mounts_file:
+                fields = line.split()
+                if fields and fields[0].startswith('/dev/'):
+                    mounted.add(os.path.realpath(fields[0]))
+    except (IOError, OSError) as err:
+        log.debug("Failed reading {0}:{1}".format(_PROC_MOUNTS, err))
+    return mounted
+
+
+def osd_dev_status(devs=None, max_age=None):
+    '''
+    Get whether disks are prepared and active as OSDs
+
+    CLI Example:
+
+    .. code-block:: bash
+
+        salt '*' ceph_cfg.osd_dev_status 'devs'='["/dev/vdb", "/dev/vdc"]'
+
+    Notes:
+    All disks are answered from one partition inventory scan and one read
+    of the mounted file systems.
+
+    devs
+        List of disks to check. Defaults to all disks with OSD partitions.
+
+    max_age
+        Maximum age in seconds of the cached inventory. By default cached
+        results are used until a block device changes.
+
+    Returns a dictionary by disk with "prepared" set if the disk has OSD
+    data partitions, "active" set if any of them is mounted, and the OSD
+    data "partitions".
+    '''
+    partitions = {}
+    for part in _listed_devices(partition_list_osd(max_age=max_age)):
+        partitions.setdefault(_partition_parent(part), []).append(part)
+    if devs is None:
+        devs = sorted(partitions)
+    elif not isinstance(devs, (list, tuple)):
+        raise CommandExecutionError("Invalid devs:{0}".format(devs))
+    mounted = _mounted_devices()
+    status = {}
+    for dev in devs:
+        parts = sorted(partitions.get(dev, []))
+        if dev in [part for values in partitions.values() for part in values]:
+            parts = [dev]
+        status[dev] = {
+            'prepared': bool(parts),
+            'active': any(os.path.realpath(part) in mounted for part in parts),
+            'partitions': parts
+        }
+    return status
 
 
 def zap(target=None, **kwargs):
@@ -128,7 +1278,45 @@ def zap(target=None, **kwargs):
         log.warning("Depricated use of function, use kwargs")
     target = kwargs.get("dev", target)
     kwargs["dev"] = target
-    return ceph_cfg.zap(**kwargs)
+    try:
+        return ceph_cfg.zap(**_cluster_args(kwargs))
+    finally:
+        _inventory_invalidate()
+
+
+def zap_many(devs=None, max_workers=None, **kwargs):
+    '''
+    Destroy the partition table and content of many disks concurrently.
+
+    .. code-block:: bash
+
+        salt '*' ceph_cfg.zap_many 'devs'='["/dev/vdb", "/dev/vdc"]' \\
+                'max_workers'='8' \\
+                'cluster_name'='ceph' \\
+                'cluster_uuid'='cluster_uuid'
+
+    Notes:
+
+    devs
+        Required paramter
+        List of block devices to format.
+
+    max_workers
+        Maximum number of disks zapped concurrently. Defaults to 8.
+
+    All other arguments are passed to zap for every device.
+
+    Returns a dictionary by device with the result, return value or comment
+    on failure and duration in seconds of each zap. A failure to zap one
+    disk does not stop the other disks being zapped.
+    '''
+    specs = _item_specs(devs, 'dev', 'device', **kwargs)
+
+    def _zap(params):
+        return zap(**params)
+
+    results = _run_many(_zap, specs, max_workers)
+    return dict((params['dev'], result) for params, result in zip(specs, results))
 
 
 def osd_prepare(**kwargs):
@@ -152,7 +1340,13 @@ def osd_prepare(**kwargs):
         Set the deivce to store the osd data on.
 
     journal_dev
-        Set the journal device. defaults to osd_dev.
+        Set the journal device. defaults to osd_dev. Set to "auto" to use
+        the non rotational disk with the fewest journals.
+
+    max_journals
+        Maximum journals per disk when journal_dev is "auto". Defaults to
+        the option ceph_cfg.journal_max or the ceph_cfg.journal_ratio_ssd
+        and ceph_cfg.journal_ratio_nvme options, 4 and 12 by default.
 
     cluster_name
         Set the cluster name. Defaults to "ceph".
@@ -169,7 +1363,12 @@ def osd_prepare(**kwargs):
     journal_uuid
         set the OSD journal UUID. If set will return if OSD with journal UUID already exists.
     '''
-    return ceph_cfg.osd_prepare(**kwargs)
+    max_journals = kwargs.pop('max_journals', None) or _option('journal_max', None)
+    kwargs = _journal_auto([kwargs], max_journals)[0]
+    try:
+        return ceph_cfg.osd_prepare(**_cluster_args(kwargs))
+    finally:
+        _inventory_invalidate()
 
 
 def osd_activate(**kwargs):
@@ -182,67 +1381,500 @@ def osd_activate(**kwargs):
 
         salt '*' ceph_cfg.osd_activate 'osd_dev'='/dev/vdc'
     '''
-    return ceph_cfg.osd_activate(**kwargs)
+    try:
+        return ceph_cfg.osd_activate(**kwargs)
+    finally:
+        _inventory_invalidate()
 
 
-def osd_reweight(**kwargs):
-    """
-    Reweight an OSD
+def osd_prepare_many(devices=None, max_workers=None, **kwargs):
+    '''
+    prepare many OSDs in one call
 
     CLI Example:
 
     .. code-block:: bash
 
-        salt '*' ceph_cfg.osd_reweight \\
-                'cluster_name'='admin' \\
+        salt '*' ceph_cfg.osd_prepare_many \\
+                'devices'='["/dev/vdb", {"osd_dev": "/dev/vdc", "journal_dev": "/dev/vdd"}]' \\
+                'max_workers'='8' \\
                 'cluster_name'='ceph' \\
-                'osd_number'='23' \\
-                'weight'='0'
+                'cluster_uuid'='cluster_uuid'
     Notes:
 
+    devices
+        Required paramter
+        List of devices to prepare. Each entry is either an osd_dev path or
+        a dictionary of osd_prepare arguments for that device, allowing
+        journal_dev, osd_uuid and journal_uuid to be set per device.
 
-    osd_number
-        OSD number to reweight.
+    max_workers
+        Maximum number of devices prepared concurrently. Defaults to 8.
+        Devices sharing a journal_dev are always prepared one at a time.
 
-    weight
-        The new weight for the osd. Weight is a float, and must be
-        in the range 0 to 1. Setting the weight to 0 will drain an OSD.
+    All other arguments are passed to osd_prepare for every device. A
+    journal_dev of "auto" is resolved for all devices before any is
+    prepared.
 
-    cluster_uuid
-        Set the deivce to store the osd data on.
+    Returns a dictionary by osd_dev with the result, return value or
+    comment on failure and duration in seconds of each osd_prepare call.
+    '''
+    max_journals = kwargs.pop('max_journals', None) or _option('journal_max', None)
+    specs = _journal_auto(_item_specs(devices, 'osd_dev', 'device', **kwargs), max_journals)
 
-    cluster_name
-        Set the cluster name. Defaults to "ceph".
-    """
-    return ceph_cfg.osd_reweight(**kwargs)
+    def _journal(params):
+        return params.get('journal_dev') or params['osd_dev']
 
+    def _prepare(params):
+        return osd_prepare(**params)
 
-def keyring_create(**kwargs):
+    results = _run_many(_prepare, specs, max_workers, group_key=_journal)
+    return dict((params['osd_dev'], result) for params, result in zip(specs, results))
+
+
+def osd_activate_many(devices=None, max_workers=None, **kwargs):
     '''
-    Create keyring for cluster
+    Activate many OSDs in one call
 
     CLI Example:
 
     .. code-block:: bash
 
-        salt '*' ceph_cfg.keyring_create \\
-                'keyring_type'='admin' \\
-                'cluster_name'='ceph' \\
-                'cluster_uuid'='cluster_uuid'
+        salt '*' ceph_cfg.osd_activate_many \\
+                'devices'='["/dev/vdb", "/dev/vdc"]' \\
+                'max_workers'='8'
     Notes:
 
-    keyring_type
+    devices
         Required paramter
-        Can be set to:
-            admin, mon, osd, rgw, mds
+        List of devices to activate. Each entry is either an osd_dev path or
+        a dictionary of osd_activate arguments for that device.
 
-    cluster_uuid
+    max_workers
+        Maximum number of devices activated concurrently. Defaults to 8.
+
+    All other arguments are passed to osd_activate for every device.
+
+    Returns a dictionary by osd_dev with the result, return value or
+    comment on failure and duration in seconds of each osd_activate call.
+    '''
+    specs = _item_specs(devices, 'osd_dev', 'device', **kwargs)
+
+    def _activate(params):
+        return osd_activate(**params)
+
+    results = _run_many(_activate, specs, max_workers)
+    return dict((params['osd_dev'], result) for params, result in zip(specs, results))
+
+
+def osd_activate_all(max_workers=None, timeout=None, max_age=None, interval=1):
+    '''
+    Activate all prepared OSDs which are not active
+
+    CLI Example:
+
+    .. code-block:: bash
+
+        salt '*' ceph_cfg.osd_activate_all \\
+                'max_workers'='8' \\
+                'timeout'='300'
+    Notes:
+    Disks with OSD partitions found by partition_list_osd which are not
+    mounted are activated concurrently, for example after a reboot. Each
+    activation runs as a background job, as started by job_start, so
+    activations still running when this returns are not ended with the
+    salt job.
+
+    max_workers
+        Maximum number of disks activated concurrently. Defaults to the
+        option ceph_cfg.activate_max_workers or 8. An activation running
+        past timeout keeps its place until it finishes. Once every place
+        is taken by such an activation, the disks not yet started are
+        reported as not started and this returns.
+
+    timeout
+        Seconds after which an activation is reported as still running
+        and no longer waited for. Defaults to the option
+        ceph_cfg.activate_timeout or no limit.
+
+    max_age
+        Maximum age in seconds of the cached inventory. By default cached
+        results are used until a block device changes.
+
+    interval
+        Delay in seconds between checks of the activations. Defaults to 1.
+
+    Returns a dictionary by osd_dev with the result, return value or
+    comment on failure and duration in seconds of each osd_activate call.
+    Activations still running have "result" None, and the "job" handle to
+    pass to job_status and job_wait. Disks not started have "result" False.
+    '''
+    workers = _max_workers(max_workers or _option('activate_max_workers', None))
+    timeout = timeout or _option('activate_timeout', None)
+    status = osd_dev_status(max_age=max_age)
+    pending = [dev for dev, dev_status in sorted(status.items()) if not dev_status['active']]
+    running = {}
+    results = {}
+    while True:
+        while pending and len(running) < workers:
+            osd_dev = pending.pop(0)
+            running[osd_dev] = (job_start('osd_activate', osd_dev=osd_dev), time.time())
+        for osd_dev, (handle, started) in list(running.items()):
+            record = job_status(handle)
+            if record['state'] != 'running':
+                del running[osd_dev]
+                results[osd_dev] = dict((key, record[key]) for key in ('result', 'return', 'comment', 'duration')
+                                        if key in record)
+                if record['state'] == 'lost':
+                    results[osd_dev].update({'result': False, 'comment': 'activation process lost'})
+            elif timeout is not None and time.time() - started > float(timeout):
+                results[osd_dev] = {
+                    'result': None,
+                    'comment': "still running after {0} seconds".format(timeout),
+                    'job': handle,
+                    'duration': round(time.time() - started, 3)
+                }
+        if all(osd_dev in results for osd_dev in running) and (not pending or running):
+            break
+        time.sleep(float(interval))
+    for osd_dev in pending:
+        results[osd_dev] = {
+            'result': False,
+            'comment': "not started, activations still running after {0} seconds".format(timeout),
+            'duration': 0
+        }
+    return results
+
+
+def osd_reweight(**kwargs):
+    """
+    Reweight an OSD
+
+    CLI Example:
+
+    .. code-block:: bash
+
+        salt '*' ceph_cfg.osd_reweight \\
+                'cluster_name'='admin' \\
+                'cluster_name'='ceph' \\
+                'osd_number'='23' \\
+                'weight'='0'
+    Notes:
+
+
+    osd_number
+        OSD number to reweight.
+
+    weight
+        The new weight for the osd. Weight is a float, and must be
+        in the range 0 to 1. Setting the weight to 0 will drain an OSD.
+
+    cluster_uuid
+        Set the deivce to store the osd data on.
+
+    cluster_name
+        Set the cluster name. Defaults to "ceph".
+    """
+    return ceph_cfg.osd_reweight(**_cluster_args(kwargs))
+
+
+def _rados_available():
+    """
+    Utility function: Find python-rados without importing it
+    """
+    if not _option('rados', True):
+        return False
+    if find_spec is None:
+        try:
+            imp.find_module('rados')
+        except ImportError:
+            return False
+        return True
+    try:
+        return find_spec('rados') is not None
+    except (ImportError, ValueError):
+        return False
+
+
+def _rados_shutdown(handle):
+    """
+    Utility function: Close a cluster handle, ignoring errors
+    """
+    try:
+        handle.shutdown()
+    except Exception as err:  # pylint: disable=broad-except
+        log.debug("Failed closing cluster handle:{0}".format(err))
+
+
+def _rados_checkout(cluster_name=None, cluster_uuid=None):
+    """
+    Utility function: Get a connected cluster handle from the pool
+
+    Handles idle for longer than the "ceph_cfg.rados_idle" option are
+    closed, and pooled handles which are no longer connected are dropped.
+    A new handle is connected if none is left, unless connecting to the
+    cluster failed within the "ceph_cfg.rados_retry" option in seconds.
+    """
+    key = _cluster_key(cluster_name, cluster_uuid)
+    idle = float(_option('rados_idle', _DEFAULT_RADOS_IDLE))
+    expired = []
+    handle = None
+    with _RADOS_LOCK:
+        now = time.time()
+        for pool_key in list(_RADOS):
+            expired.extend(entry[0] for entry in _RADOS[pool_key] if now - entry[1] > idle)
+            _RADOS[pool_key] = [entry for entry in _RADOS[pool_key] if now - entry[1] <= idle]
+        while _RADOS.get(key):
+            candidate = _RADOS[key].pop()[0]
+            if candidate.state == 'connected':
+                handle = candidate
+                break
+            expired.append(candidate)
+    for stale in expired:
+        _rados_shutdown(stale)
+    if handle is not None:
+        return handle
+    retry = float(_option('rados_retry', _DEFAULT_RADOS_RETRY))
+    with _RADOS_LOCK:
+        failed = _RADOS_FAILED.get(key)
+    if failed is not None and time.time() - failed < retry:
+        raise CommandExecutionError("Connecting to cluster {0} failed {1:.0f} seconds ago".format(
+            key[0], time.time() - failed))
+    handle = rados.Rados(
+        clustername=key[0],
+        conffile='/etc/ceph/{0}.conf'.format(key[0]),
+        name='client.admin')
+    try:
+        handle.connect(timeout=int(_option('rados_timeout', _DEFAULT_RADOS_TIMEOUT)))
+    except Exception:
+        with _RADOS_LOCK:
+            _RADOS_FAILED[key] = time.time()
+        _rados_shutdown(handle)
+        raise
+    with _RADOS_LOCK:
+        _RADOS_FAILED.pop(key, None)
+    try:
+        if cluster_uuid is not None and handle.get_fsid() != cluster_uuid:
+            raise CommandExecutionError("Cluster uuid mismatch:{0}".format(cluster_uuid))
+    except Exception:
+        _rados_shutdown(handle)
+        raise
+    return handle
+
+
+def _rados_checkin(handle, cluster_name=None, cluster_uuid=None, healthy=True):
+    """
+    Utility function: Return a cluster handle to the pool
+
+    Handles which failed, or exceed the "ceph_cfg.rados_pool_size" option
+    of idle handles per cluster, are closed.
+    """
+    key = _cluster_key(cluster_name, cluster_uuid)
+    size = int(_option('rados_pool_size', _DEFAULT_RADOS_POOL_SIZE))
+    if healthy:
+        with _RADOS_LOCK:
+            entries = _RADOS.setdefault(key, [])
+            if len(entries) < size:
+                entries.append([handle, time.time()])
+                return
+    _rados_shutdown(handle)
+
+
+def _rados_command(prefix, args=None, cluster_name=None, cluster_uuid=None):
+    """
+    Utility function: Run a monitor command over a pooled cluster handle
+
+    Commands time out after the "ceph_cfg.rados_timeout" option in
+    seconds, so a handle does not block once quorum is lost. Returns the
+    command output.
+    """
+    command = dict(args or [], prefix=prefix, format='json')
+    timeout = int(_option('rados_timeout', _DEFAULT_RADOS_TIMEOUT))
+    handle = _rados_checkout(cluster_name, cluster_uuid)
+    try:
+        retcode, output, error = handle.mon_command(json.dumps(command), b'', timeout=timeout)
+    except Exception:
+        _rados_checkin(handle, cluster_name, cluster_uuid, healthy=False)
+        raise
+    _rados_checkin(handle, cluster_name, cluster_uuid)
+    if retcode != 0:
+        raise CommandExecutionError("Command '{0}' failed:{1}".format(prefix, error))
+    return output
+
+
+def _mon_command(prefix, args=None, cluster_name=None, cluster_uuid=None):
+    """
+    Utility function: Run a monitor command
+
+    Uses a pooled python-rados cluster handle when python-rados is
+    installed, and the ceph command line tool otherwise. args is a list of
+    argument name and value pairs. Returns the command output.
+    """
+    args = list(args or [])
+    if _rados_available():
+        return _rados_command(prefix, args, cluster_name, cluster_uuid)
+    cmd = ['ceph', '--cluster', cluster_name or 'ceph']
+    cmd.extend(prefix.split())
+    cmd.extend(str(value) for _, value in args)
+    cmd.extend(['--format', 'json'])
+    output = __salt__['cmd.run_all'](cmd, python_shell=False)
+    if output.get('retcode') != 0:
+        raise CommandExecutionError("Command '{0}' failed:{1}".format(
+            prefix, output.get('stderr') or 'retcode {0}'.format(output.get('retcode'))))
+    return output.get('stdout')
+
+
+def _mon_query(prefix, fallback, kwargs, convert):
+    """
+    Utility function: Run a library query as a monitor command
+
+    Uses a pooled python-rados cluster handle, saving the connection set
+    up of the library. The library function fallback is called with kwargs
+    when python-rados is not installed or the command fails. convert turns
+    the parsed output into the result of the library function, so the
+    result is the same either way. Only use this for library functions
+    whose result convert can rebuild.
+    """
+    if _rados_available():
+        try:
+            output = _rados_command(prefix, None, kwargs.get('cluster_name'), kwargs.get('cluster_uuid'))
+            if isinstance(output, bytes):
+                output = output.decode('utf-8')
+            return convert(json.loads(output) if output else None)
+        except Exception as err:  # pylint: disable=broad-except
+            log.debug("Monitor command '{0}' failed, using the library:{1}".format(prefix, err))
+    return fallback(**_cluster_args(kwargs))
+
+
+def _mon_json(prefix, args=None, cluster_name=None, cluster_uuid=None):
+    """
+    Utility function: Run a monitor command and parse its JSON output
+    """
+    output = _mon_command(prefix, args, cluster_name, cluster_uuid)
+    if isinstance(output, bytes):
+        output = output.decode('utf-8')
+    try:
+        return json.loads(output) if output else None
+    except ValueError:
+        raise CommandExecutionError("Invalid output of '{0}':{1}".format(prefix, output))
+
+
+def _reweight_weights(weights):
+    """
+    Utility function: Validate a dictionary of OSD weights
+
+    Returns a dictionary of weights by OSD number.
+    """
+    if not isinstance(weights, dict) or not weights:
+        raise CommandExecutionError("Required paramter 'weights' not set")
+    validated = {}
+    for osd_number, weight in weights.items():
+        try:
+            osd_number = int(osd_number)
+            weight = float(weight)
+        except (TypeError, ValueError):
+            raise CommandExecutionError("Invalid weight for osd {0}:{1}".format(osd_number, weight))
+        if osd_number < 0 or not 0 <= weight <= 1:
+            raise CommandExecutionError("Invalid weight for osd {0}:{1}".format(osd_number, weight))
+        validated[osd_number] = weight
+    return validated
+
+
+def _reweightn(weights, cluster_name=None, cluster_uuid=None):
+    """
+    Utility function: Reweight OSDs with one "osd reweightn" monitor command
+
+    Weights are passed as 16.16 fixed point integers. Returns the error
+    on failure and None on success.
+    """
+    fixed = dict((str(osd_number), int(round(weight * 0x10000))) for osd_number, weight in weights.items())
+    try:
+        _mon_command('osd reweightn', [('weights', json.dumps(fixed, sort_keys=True))],
+                     cluster_name, cluster_uuid)
+    except Exception as err:  # pylint: disable=broad-except
+        return str(err)
+    return None
+
+
+def osd_reweight_many(weights=None, max_workers=None, **kwargs):
+    """
+    Reweight many OSDs in one change
+
+    CLI Example:
+
+    .. code-block:: bash
+
+        salt '*' ceph_cfg.osd_reweight_many \\
+                'weights'='{"23": 0, "24": 0.5}' \\
+                'cluster_name'='ceph'
+    Notes:
+    Every weight is validated before any change is made. All weights are
+    then applied with one "osd reweightn" monitor command, giving one
+    new osdmap epoch instead of one per OSD. If the batched command fails
+    each OSD is reweighted with osd_reweight.
+
+    weights
+        Required paramter
+        Dictionary of weights by OSD number. Weights must be in the range
+        0 to 1.
+
+    max_workers
+        Maximum number of OSDs reweighted concurrently when falling back
+        to osd_reweight. Defaults to 8.
+
+    cluster_uuid
+        Set the cluster UUID. Defaults to value found in ceph config file.
+
+    cluster_name
+        Set the cluster name. Defaults to "ceph".
+
+    Returns a dictionary of results by OSD number, each with "result" and
+    "weight", or "comment" on failure.
+    """
+    weights = _reweight_weights(weights)
+    error = _reweightn(weights, kwargs.get('cluster_name'), kwargs.get('cluster_uuid'))
+    if error is None:
+        return dict((osd_number, {'result': True, 'weight': weight}) for osd_number, weight in weights.items())
+    log.info("Batched reweight failed, reweighting each osd:{0}".format(error))
+    changes = sorted(weights.items())
+    results = _run_many(
+        lambda change: osd_reweight(osd_number=change[0], weight=change[1], **kwargs),
+        changes, max_workers)
+    output = {}
+    for change, result in zip(changes, results):
+        if result['result']:
+            output[change[0]] = {'result': True, 'weight': change[1]}
+        else:
+            output[change[0]] = {'result': False, 'comment': result['comment']}
+    return output
+
+
+def keyring_create(**kwargs):
+    '''
+    Create keyring for cluster
+
+    CLI Example:
+
+    .. code-block:: bash
+
+        salt '*' ceph_cfg.keyring_create \\
+                'keyring_type'='admin' \\
+                'cluster_name'='ceph' \\
+                'cluster_uuid'='cluster_uuid'
+    Notes:
+
+    keyring_type
+        Required paramter
+        Can be set to:
+            admin, mon, osd, rgw, mds
+
+    cluster_uuid
         Set the cluster UUID. Defaults to value found in ceph config file.
 
     cluster_name
         Set the cluster name. Defaults to "ceph".
     '''
-    return ceph_cfg.keyring_create(**kwargs)
+    return ceph_cfg.keyring_create(**_cluster_args(kwargs))
 
 
 def keyring_save(**kwargs):
@@ -271,7 +1903,7 @@ def keyring_save(**kwargs):
     cluster_name
         Set the cluster name. Defaults to "ceph".
     '''
-    return ceph_cfg.keyring_save(**kwargs)
+    return ceph_cfg.keyring_save(**_cluster_args(kwargs))
 
 
 def keyring_purge(**kwargs):
@@ -301,7 +1933,7 @@ def keyring_purge(**kwargs):
 
     If no ceph config file is found, this command will fail.
     '''
-    return ceph_cfg.keyring_purge(**kwargs)
+    return ceph_cfg.keyring_purge(**_cluster_args(kwargs))
 
 
 def keyring_present(**kwargs):
@@ -329,7 +1961,7 @@ def keyring_present(**kwargs):
     cluster_name
         Set the cluster name. Defaults to "ceph".
     '''
-    return ceph_cfg.keyring_present(**kwargs)
+    return ceph_cfg.keyring_present(**_cluster_args(kwargs))
 
 
 def keyring_auth_add(**kwargs):
@@ -357,7 +1989,10 @@ def keyring_auth_add(**kwargs):
     cluster_name
         Set the cluster name. Defaults to "ceph".
     '''
-    return ceph_cfg.keyring_auth_add(**kwargs)
+    try:
+        return ceph_cfg.keyring_auth_add(**_cluster_args(kwargs))
+    finally:
+        _auth_invalidate()
 
 
 def keyring_auth_del(**kwargs):
@@ -385,7 +2020,10 @@ def keyring_auth_del(**kwargs):
     cluster_name
         Set the cluster name. Defaults to "ceph".
     '''
-    return ceph_cfg.keyring_auth_del(**kwargs)
+    try:
+        return ceph_cfg.keyring_auth_del(**_cluster_args(kwargs))
+    finally:
+        _auth_invalidate()
 
 
 def keyring_admin_create(**kwargs):
@@ -937,6 +2575,132 @@ def keyring_rgw_purge(**kwargs):
     return keyring_purge(**params)
 
 
+def _auth_entries(listing):
+    '''
+    Utility function: Index a cephx authorization list by entity name
+    '''
+    if isinstance(listing, dict) and 'auth_dump' in listing:
+        listing = listing['auth_dump']
+    if isinstance(listing, (list, tuple)):
+        return dict((item['entity'], item) for item in listing if 'entity' in item)
+    if isinstance(listing, dict):
+        return dict(listing)
+    return {}
+
+
+def _auth_index(**kwargs):
+    '''
+    Utility function: Get the cached authorization list and its index
+
+    Returns a tuple of the authorization list and a dictionary of entries
+    by entity name. Passing refresh=True in kwargs always queries the
+    cluster.
+    '''
+    refresh = kwargs.pop('refresh', False)
+    ttl = float(_option('auth_ttl', _DEFAULT_AUTH_TTL))
+    key = json.dumps(_cluster_key(kwargs.get('cluster_name'), kwargs.get('cluster_uuid')))
+    with _AUTH_LOCK:
+        cached = _AUTH.get(key)
+    if refresh or cached is None or time.time() - cached[0] > ttl:
+        listing = ceph_cfg.keyring_auth_list(**_cluster_args(kwargs))
+        cached = (time.time(), listing, _auth_entries(listing))
+        with _AUTH_LOCK:
+            _AUTH[key] = cached
+    return cached[1], cached[2]
+
+
+def _auth_invalidate():
+    '''
+    Utility function: Drop the cached authorization list after changes
+    '''
+    with _AUTH_LOCK:
+        _AUTH.clear()
+
+
+def keyring_bundle_apply(types=None, secrets=None, **kwargs):
+    '''
+    Create, save and authorise many keyrings in one call
+
+    CLI Example:
+
+    .. code-block:: bash
+
+        salt '*' ceph_cfg.keyring_bundle_apply \\
+                'types'='["admin", "mon", "osd", "rgw", "mds"]' \\
+                'secrets'='{"admin": "AQBR8KhWgKw6FhAAoXvTT6MdBE+bV+zPKzIo6w=="}' \\
+                'cluster_name'='ceph' \\
+                'cluster_uuid'='cluster_uuid'
+    Notes:
+
+    types
+        List of keyring types to apply. Defaults to all types:
+            admin, mon, osd, rgw, mds
+
+    secrets
+        Dictionary of secrets by keyring type. Keyrings without a secret are
+        created with keyring_create before being saved.
+
+    cluster_uuid
+        Set the cluster UUID. Defaults to value found in ceph config file.
+
+    cluster_name
+        Set the cluster name. Defaults to "ceph".
+
+    The osd, rgw and mds keyrings are added to the authorised list after
+    all keyrings are saved. The authorised list is read once and keyrings
+    already authorised are not added again.
+
+    Returns a dictionary by keyring type with the result of each step.
+    '''
+    if types is None:
+        types = sorted(_KEYRING_ENTITIES)
+    if secrets is None:
+        secrets = {}
+    if not isinstance(types, (list, tuple)):
+        raise CommandExecutionError("Invalid types:{0}".format(types))
+    if not isinstance(secrets, dict):
+        raise CommandExecutionError("Invalid secrets:{0}".format(secrets))
+    for keyring_type in list(types) + list(secrets):
+        if keyring_type not in _KEYRING_ENTITIES:
+            raise CommandExecutionError("Invalid keyring_type:{0}".format(keyring_type))
+    output = {}
+    for keyring_type in types:
+        steps = {}
+        output[keyring_type] = steps
+        params = dict(kwargs)
+        params['keyring_type'] = keyring_type
+        if keyring_type in secrets:
+            params['secret'] = secrets[keyring_type]
+        else:
+            steps['create'] = _timed_call(lambda item: keyring_create(**item), params)
+            if not steps['create']['result']:
+                continue
+            params['key_content'] = str(steps['create']['return'])
+        steps['save'] = _timed_call(lambda item: keyring_save(**item), params)
+
+    auth_types = [keyring_type for keyring_type in types
+                  if keyring_type in _KEYRING_AUTH_TYPES and output[keyring_type].get('save', {}).get('result')]
+    if not auth_types:
+        return output
+    listing = _timed_call(lambda item: _auth_index(**item)[1], dict(kwargs))
+    authorised = listing.get('return') or {}
+    for keyring_type in auth_types:
+        if _KEYRING_ENTITIES[keyring_type] in authorised:
+            output[keyring_type]['auth_add'] = {
+                'result': True,
+                'comment': "already authorised",
+                'duration': 0
+            }
+            continue
+        if not listing['result']:
+            output[keyring_type]['auth_add'] = listing
+            continue
+        params = dict(kwargs)
+        params['keyring_type'] = keyring_type
+        output[keyring_type]['auth_add'] = _timed_call(lambda item: keyring_auth_add(**item), params)
+    return output
+
+
 def mon_is(**kwargs):
     '''
     Is this a mon node
@@ -960,7 +2724,7 @@ def mon_is(**kwargs):
     cluster_uuid
         Set the cluster UUID. Defaults to value found in ceph config file.
     '''
-    return ceph_cfg.mon_is(**kwargs)
+    return ceph_cfg.mon_is(**_cluster_args(kwargs))
 
 
 def mon_status(**kwargs):
@@ -985,8 +2749,14 @@ def mon_status(**kwargs):
 
     cluster_name
         Set the cluster name. Defaults to "ceph".
+
+    refresh
+        Query the cluster even if a cached result is available. Results are
+        otherwise shared for "ceph_cfg.status_ttl" seconds, defaults to 30.
     '''
-    return ceph_cfg.mon_status(**kwargs)
+    def _loader(**params):
+        return ceph_cfg.mon_status(**_cluster_args(params))
+    return _status_query('mon_status', _loader, kwargs)
 
 
 def mon_quorum(**kwargs):
@@ -1011,8 +2781,12 @@ def mon_quorum(**kwargs):
 
     cluster_name
         Set the cluster name. Defaults to "ceph".
+
+    refresh
+        Query the cluster even if a cached result is available. Results are
+        otherwise shared for "ceph_cfg.status_ttl" seconds, defaults to 30.
     '''
-    return ceph_cfg.mon_quorum(**kwargs)
+    return _status_query('mon_quorum', ceph_cfg.mon_quorum, kwargs)
 
 
 def mon_active(**kwargs):
@@ -1037,8 +2811,12 @@ def mon_active(**kwargs):
 
     cluster_name
         Set the cluster name. Defaults to "ceph".
+
+    refresh
+        Query the cluster even if a cached result is available. Results are
+        otherwise shared for "ceph_cfg.status_ttl" seconds, defaults to 30.
     '''
-    return ceph_cfg.mon_active(**kwargs)
+    return _status_query('mon_active', ceph_cfg.mon_active, kwargs)
 
 
 def mon_create(**kwargs):
@@ -1064,7 +2842,10 @@ def mon_create(**kwargs):
     cluster_name
         Set the cluster name. Defaults to "ceph".
     '''
-    return ceph_cfg.mon_create(**kwargs)
+    try:
+        return ceph_cfg.mon_create(**_cluster_args(kwargs))
+    finally:
+        _status_invalidate()
 
 
 def mon_destroy(**kwargs):
@@ -1090,7 +2871,10 @@ def mon_destroy(**kwargs):
     cluster_name
         Set the cluster name. Defaults to "ceph".
     '''
-    return ceph_cfg.mon_destroy(**kwargs)
+    try:
+        return ceph_cfg.mon_destroy(**_cluster_args(kwargs))
+    finally:
+        _status_invalidate()
 
 
 def mon_list(**kwargs):
@@ -1112,7 +2896,7 @@ def mon_list(**kwargs):
     cluster_name
         Set the cluster name. Defaults to "ceph".
     '''
-    return ceph_cfg.mon_list(**kwargs)
+    return ceph_cfg.mon_list(**_cluster_args(kwargs))
 
 
 def rgw_pools_create(**kwargs):
@@ -1133,7 +2917,7 @@ def rgw_pools_create(**kwargs):
     cluster_name
         Set the cluster name. Defaults to "ceph".
     '''
-    return ceph_cfg.rgw_pools_create(**kwargs)
+    return ceph_cfg.rgw_pools_create(**_cluster_args(kwargs))
 
 
 def rgw_pools_missing(**kwargs):
@@ -1154,7 +2938,7 @@ def rgw_pools_missing(**kwargs):
     cluster_name
         Set the cluster name. Defaults to "ceph".
     '''
-    return ceph_cfg.rgw_pools_missing(**kwargs)
+    return ceph_cfg.rgw_pools_missing(**_cluster_args(kwargs))
 
 
 def rgw_create(**kwargs):
@@ -1182,7 +2966,7 @@ def rgw_create(**kwargs):
     cluster_name
         Set the cluster name. Defaults to "ceph".
     '''
-    return ceph_cfg.rgw_create(**kwargs)
+    return ceph_cfg.rgw_create(**_cluster_args(kwargs))
 
 
 def rgw_destroy(**kwargs):
@@ -1210,7 +2994,7 @@ def rgw_destroy(**kwargs):
     cluster_name
         Set the cluster name. Defaults to "ceph".
     '''
-    return ceph_cfg.rgw_destroy(**kwargs)
+    return ceph_cfg.rgw_destroy(**_cluster_args(kwargs))
 
 
 def mds_create(**kwargs):
@@ -1248,7 +3032,7 @@ def mds_create(**kwargs):
     cluster_name
         Set the cluster name. Defaults to "ceph".
     '''
-    return ceph_cfg.mds_create(**kwargs)
+    return ceph_cfg.mds_create(**_cluster_args(kwargs))
 
 
 def mds_destroy(**kwargs):
@@ -1276,7 +3060,7 @@ def mds_destroy(**kwargs):
     cluster_name
         Set the cluster name. Defaults to "ceph".
     '''
-    return ceph_cfg.mds_destroy(**kwargs)
+    return ceph_cfg.mds_destroy(**_cluster_args(kwargs))
 
 
 def keyring_auth_list(**kwargs):
@@ -1297,8 +3081,78 @@ def keyring_auth_list(**kwargs):
 
     cluster_uuid
         Set the cluster UUID. Defaults to value found in ceph config file.
+
+    refresh
+        Query the cluster even if a cached result is available. Results are
+        otherwise shared for "ceph_cfg.auth_ttl" seconds, defaults to 30.
+    '''
+    return copy.deepcopy(_auth_index(**kwargs)[0])
+
+
+def keyring_auth_get(entity, **kwargs):
+    '''
+    Get one cephx authorization entry
+
+    CLI Example:
+
+    .. code-block:: bash
+
+        salt '*' ceph_cfg.keyring_auth_get client.bootstrap-osd \\
+                'cluster_name'='ceph' \\
+                'cluster_uuid'='cluster_uuid'
+    Notes:
+
+    entity
+        Required paramter
+        The entity name, for example "client.bootstrap-osd".
+
+    cluster_name
+        Set the cluster name. Defaults to "ceph".
+
+    cluster_uuid
+        Set the cluster UUID. Defaults to value found in ceph config file.
+
+    refresh
+        Query the cluster even if a cached result is available.
+
+    Returns the entry or None if the entity is not authorised.
+    '''
+    return copy.deepcopy(_auth_index(**kwargs)[1].get(entity))
+
+
+def keyring_auth_has_many(entities=None, **kwargs):
+    '''
+    Check whether many entities are authorised
+
+    CLI Example:
+
+    .. code-block:: bash
+
+        salt '*' ceph_cfg.keyring_auth_has_many \\
+                'entities'='["client.bootstrap-osd", "client.bootstrap-rgw"]' \\
+                'cluster_name'='ceph' \\
+                'cluster_uuid'='cluster_uuid'
+    Notes:
+
+    entities
+        Required paramter
+        List of entity names to check.
+
+    cluster_name
+        Set the cluster name. Defaults to "ceph".
+
+    cluster_uuid
+        Set the cluster UUID. Defaults to value found in ceph config file.
+
+    refresh
+        Query the cluster even if a cached result is available.
+
+    Returns a dictionary by entity name of whether it is authorised.
     '''
-    return ceph_cfg.keyring_auth_list(**kwargs)
+    if not isinstance(entities, (list, tuple)):
+        raise CommandExecutionError("Invalid entities:{0}".format(entities))
+    index = _auth_index(**kwargs)[1]
+    return dict((entity, entity in index) for entity in entities)
 
 
 def pool_list(**kwargs):
@@ -1320,7 +3174,7 @@ def pool_list(**kwargs):
     cluster_uuid
         Set the cluster UUID. Defaults to value found in ceph config file.
     '''
-    return ceph_cfg.pool_list(**kwargs)
+    return ceph_cfg.pool_list(**_cluster_args(kwargs))
 
 
 def pool_add(pool_name, **kwargs):
@@ -1357,7 +3211,7 @@ def pool_add(pool_name, **kwargs):
     crush_ruleset
         Set the crush map rule set
     '''
-    return ceph_cfg.pool_add(pool_name, **kwargs)
+    return ceph_cfg.pool_add(pool_name, **_cluster_args(kwargs))
 
 
 def pool_del(pool_name, **kwargs):
@@ -1379,98 +3233,385 @@ def pool_del(pool_name, **kwargs):
     cluster_uuid
         Set the cluster UUID. Defaults to value found in ceph config file.
     '''
-    return ceph_cfg.pool_del(pool_name, **kwargs)
+    return ceph_cfg.pool_del(pool_name, **_cluster_args(kwargs))
 
 
-def purge(**kwargs):
+def _pool_names(listing):
     '''
-    purge ceph configuration on the node
+    Utility function: Get the pool names from a pool listing
+    '''
+    if isinstance(listing, dict):
+        return list(listing)
+    names = []
+    for item in listing or []:
+        if isinstance(item, dict):
+            name = item.get('poolname', item.get('pool_name', item.get('name')))
+            if name is not None:
+                names.append(name)
+        else:
+            names.append(item)
+    return names
+
+
+def pool_add_many(pools=None, max_workers=None, **kwargs):
+    '''
+    Create many pools
 
     CLI Example:
 
     .. code-block:: bash
 
-        salt '*' ceph_cfg.purge \\
+        salt '*' ceph_cfg.pool_add_many \\
+                'pools'='["pool1", {"name": "pool2", "pg_num": 128}]' \\
                 'cluster_name'='ceph' \\
                 'cluster_uuid'='cluster_uuid'
-
     Notes:
 
+    pools
+        Required paramter
+        List of pools to create. Each entry is either a pool name or a
+        dictionary with the pool "name" and any pool_add arguments, such as
+        pg_num, pgp_num, pool_type, erasure_code_profile and crush_ruleset.
+
+    max_workers
+        Maximum number of pools created concurrently. Defaults to 8.
+
     cluster_name
         Set the cluster name. Defaults to "ceph".
 
     cluster_uuid
         Set the cluster UUID. Defaults to value found in ceph config file.
+
+    Returns a dictionary by pool name with the result of each pool_add.
     '''
-    return ceph_cfg.purge(**kwargs)
+    specs = _item_specs(pools, 'name', 'pool', **kwargs)
 
+    def _add(params):
+        params = dict(params)
+        return pool_add(params.pop('name'), **params)
 
-def ceph_version():
-    '''
-    Get the version of ceph installed
-    '''
-    return ceph_cfg.ceph_version()
+    results = _run_many(_add, specs, max_workers)
+    return dict((params['name'], result) for params, result in zip(specs, results))
 
 
-def cluster_quorum(**kwargs):
+def pool_del_many(pool_names=None, max_workers=None, **kwargs):
     '''
-    Get the cluster's quorum status
+    Delete many pools
 
     CLI Example:
 
     .. code-block:: bash
 
-        salt '*' ceph_cfg.cluster_quorum \\
+        salt '*' ceph_cfg.pool_del_many \\
+                'pool_names'='["pool1", "pool2"]' \\
                 'cluster_name'='ceph' \\
                 'cluster_uuid'='cluster_uuid'
     Notes:
-    Get the cluster quorum status.
 
-    Scope:
-    Cluster wide
+    pool_names
+        Required paramter
+        List of pool names to delete.
 
-    Arguments:
+    max_workers
+        Maximum number of pools deleted concurrently. Defaults to 8.
+
+    cluster_name
+        Set the cluster name. Defaults to "ceph".
 
     cluster_uuid
         Set the cluster UUID. Defaults to value found in ceph config file.
 
-    cluster_name
-        Set the cluster name. Defaults to "ceph".
+    Returns a dictionary by pool name with the result of each pool_del.
     '''
-    return ceph_cfg.cluster_quorum(**kwargs)
+    specs = _item_specs(pool_names, 'name', 'pool', **kwargs)
 
+    def _del(params):
+        params = dict(params)
+        return pool_del(params.pop('name'), **params)
 
-def cluster_status(**kwargs):
+    results = _run_many(_del, specs, max_workers)
+    return dict((params['name'], result) for params, result in zip(specs, results))
+
+
+def _pool_plan(pools, current, prune=False):
     '''
-    Get the cluster status
+    Utility function: Compare desired pools with the current pool names
+
+    Returns the pool specifications to create and the pool names to delete.
+    '''
+    specs = _item_specs(pools, 'name', 'pool')
+    desired = set(params['name'] for params in specs)
+    creates = [params for params in specs if params['name'] not in current]
+    deletes = []
+    if prune:
+        deletes = sorted(name for name in current if name not in desired)
+    return creates, deletes
+
+
+def pool_apply(pools=None, prune=False, max_workers=None, test=False, **kwargs):
+    '''
+    Make the cluster pools match a list of pools
 
     CLI Example:
 
     .. code-block:: bash
 
-        salt '*' ceph_cfg.cluster_status \\
+        salt '*' ceph_cfg.pool_apply \\
+                'pools'='[{"name": "pool1", "pg_num": 128}, "pool2"]' \\
+                'prune'='False' \\
                 'cluster_name'='ceph' \\
                 'cluster_uuid'='cluster_uuid'
     Notes:
-    Get the cluster status including health if in quorum.
+    Reads the pool list once and only creates or deletes the pools which
+    differ. Pools are created and deleted concurrently.
 
-    Scope:
-    Cluster wide
+    pools
+        Required paramter
+        List of pools. Each entry is either a pool name or a dictionary with
+        the pool "name" and any pool_add arguments, such as pg_num,
+        pgp_num, pool_type, erasure_code_profile and crush_ruleset.
 
-    Arguments:
+    prune
+        Delete pools not in the list. Defaults to False.
 
-    cluster_uuid
-        Set the cluster UUID. Defaults to value found in ceph config file.
+    max_workers
+        Maximum number of pools changed concurrently. Defaults to 8.
+
+    test
+        Only return the pools which would be created and deleted.
 
     cluster_name
         Set the cluster name. Defaults to "ceph".
+
+    cluster_uuid
+        Set the cluster UUID. Defaults to value found in ceph config file.
+
+    Returns a dictionary with the "created" and "deleted" results by pool
+    name, and the "unchanged" pool names.
     '''
-    return ceph_cfg.cluster_status(**kwargs)
+    current = _pool_names(pool_list(**kwargs))
+    creates, deletes = _pool_plan(pools, current, prune)
+    created_names = set(params['name'] for params in creates)
+    output = {
+        'unchanged': sorted(name for name in current if name not in deletes and name not in created_names)
+    }
+    if test:
+        output['created'] = dict((params['name'], None) for params in creates)
+        output['deleted'] = dict((name, None) for name in deletes)
+        return output
+    output['created'] = pool_add_many(creates, max_workers, **kwargs) if creates else {}
+    output['deleted'] = pool_del_many(deletes, max_workers, **kwargs) if deletes else {}
+    return output
 
 
-def cephfs_list(**kwargs):
+def purge(**kwargs):
     '''
-    list the cephfs filesystems
+    purge ceph configuration on the node
+
+    CLI Example:
+
+    .. code-block:: bash
+
+        salt '*' ceph_cfg.purge \\
+                'cluster_name'='ceph' \\
+                'cluster_uuid'='cluster_uuid'
+
+    Notes:
+
+    cluster_name
+        Set the cluster name. Defaults to "ceph".
+
+    cluster_uuid
+        Set the cluster UUID. Defaults to value found in ceph config file.
+    '''
+    try:
+        return ceph_cfg.purge(**_cluster_args(kwargs))
+    finally:
+        _inventory_invalidate()
+        _status_invalidate()
+        _auth_invalidate()
+
+
+def ceph_version():
+    '''
+    Get the version of ceph installed
+    '''
+    return ceph_cfg.ceph_version()
+
+
+def config_get(key=None, section='global', cluster_name=None):
+    '''
+    Get a value from the ceph config file
+
+    CLI Example:
+
+    .. code-block:: bash
+
+        salt '*' ceph_cfg.config_get 'key'='fsid' 'cluster_name'='ceph'
+
+    Notes:
+    The config file is parsed once and again only when it changes. The
+    cluster uuid is passed from this cache to the library, but the library
+    still reads the config file itself for other settings, such as the mon
+    addresses and keyring paths, on calls it handles.
+
+    key
+        Required paramter
+        Config key to get. Spaces and underscores in keys are equivalent.
+
+    section
+        Config section to look in. Keys missing in a daemon section such
+        as "osd.0" are looked up in the "osd" section and then in
+        "global". Defaults to "global".
+
+    cluster_name
+        Set the cluster name. Defaults to "ceph".
+
+    Returns the value, or None if not set.
+    '''
+    if not key:
+        raise CommandExecutionError("Required paramter 'key' not set")
+    return _conf_value(key, section, cluster_name)
+
+
+def cluster_quorum(**kwargs):
+    '''
+    Get the cluster's quorum status
+
+    CLI Example:
+
+    .. code-block:: bash
+
+        salt '*' ceph_cfg.cluster_quorum \\
+                'cluster_name'='ceph' \\
+                'cluster_uuid'='cluster_uuid'
+    Notes:
+    Get the cluster quorum status.
+
+    Scope:
+    Cluster wide
+
+    Arguments:
+
+    cluster_uuid
+        Set the cluster UUID. Defaults to value found in ceph config file.
+
+    cluster_name
+        Set the cluster name. Defaults to "ceph".
+
+    refresh
+        Query the cluster even if a cached result is available. Results are
+        otherwise shared for "ceph_cfg.status_ttl" seconds, defaults to 30,
+        and read from the salt mine if published by mine_status.
+    '''
+    def _loader(**params):
+        return _mon_query('quorum_status', ceph_cfg.cluster_quorum, params,
+                          lambda output: bool(output.get('quorum_names')))
+    return _status_query('cluster_quorum', _loader, kwargs)
+
+
+def wait_for_quorum(timeout=300, interval=1, max_interval=30, **kwargs):
+    '''
+    Wait for the cluster to be in quorum
+
+    CLI Example:
+
+    .. code-block:: bash
+
+        salt '*' ceph_cfg.wait_for_quorum \\
+                'timeout'='300' \\
+                'cluster_name'='ceph' \\
+                'cluster_uuid'='cluster_uuid'
+    Notes:
+    Polls the cluster quorum status with exponential backoff and jitter so
+    many nodes waiting together do not load the mon daemons.
+
+    Scope:
+    Cluster wide
+
+    Arguments:
+
+    timeout
+        Maximum time in seconds to wait. Defaults to 300.
+
+    interval
+        Initial delay in seconds between checks. Defaults to 1.
+
+    max_interval
+        Maximum delay in seconds between checks. Defaults to 30.
+
+    cluster_uuid
+        Set the cluster UUID. Defaults to value found in ceph config file.
+
+    cluster_name
+        Set the cluster name. Defaults to "ceph".
+
+    Returns a dictionary with "quorum", the number of "attempts" and the
+    "elapsed" time in seconds.
+    '''
+    params = dict(kwargs)
+    params['refresh'] = True
+    start = time.time()
+    deadline = start + float(timeout)
+    delay = float(interval)
+    attempts = 0
+    while True:
+        attempts += 1
+        try:
+            quorum = cluster_quorum(**params)
+        except Exception as err:  # pylint: disable=broad-except
+            log.debug("cluster_quorum failed:{0}".format(err))
+            quorum = False
+        remaining = deadline - time.time()
+        if quorum or remaining <= 0:
+            break
+        time.sleep(min(remaining, delay * random.uniform(0.5, 1.0)))
+        delay = min(float(max_interval), delay * 2)
+    return {
+        'quorum': bool(quorum),
+        'attempts': attempts,
+        'elapsed': round(time.time() - start, 3)
+    }
+
+
+def cluster_status(**kwargs):
+    '''
+    Get the cluster status
+
+    CLI Example:
+
+    .. code-block:: bash
+
+        salt '*' ceph_cfg.cluster_status \\
+                'cluster_name'='ceph' \\
+                'cluster_uuid'='cluster_uuid'
+    Notes:
+    Get the cluster status including health if in quorum.
+
+    Scope:
+    Cluster wide
+
+    Arguments:
+
+    cluster_uuid
+        Set the cluster UUID. Defaults to value found in ceph config file.
+
+    cluster_name
+        Set the cluster name. Defaults to "ceph".
+
+    refresh
+        Query the cluster even if a cached result is available. Results are
+        otherwise shared for "ceph_cfg.status_ttl" seconds, defaults to 30,
+        and read from the salt mine if published by mine_status.
+    '''
+    def _loader(**params):
+        return ceph_cfg.cluster_status(**_cluster_args(params))
+    return _status_query('cluster_status', _loader, kwargs)
+
+
+def cephfs_list(**kwargs):
+    '''
+    list the cephfs filesystems
 
     CLI Example:
 
@@ -1493,7 +3634,7 @@ def cephfs_list(**kwargs):
     cluster_name
         Set the cluster name. Defaults to "ceph".
     '''
-    return ceph_cfg.cephfs_ls(**kwargs)
+    return ceph_cfg.cephfs_ls(**_cluster_args(kwargs))
 
 
 def cephfs_add(fs_name, **kwargs):
@@ -1533,7 +3674,7 @@ def cephfs_add(fs_name, **kwargs):
     cluster_name
         Set the cluster name. Defaults to "ceph".
     '''
-    return ceph_cfg.cephfs_add(fs_name, **kwargs)
+    return ceph_cfg.cephfs_add(fs_name, **_cluster_args(kwargs))
 
 
 def cephfs_del(fs_name, **kwargs):
@@ -1565,4 +3706,999 @@ def cephfs_del(fs_name, **kwargs):
     cluster_name
         Set the cluster name. Defaults to "ceph".
     '''
-    return ceph_cfg.cephfs_del(fs_name, **kwargs)
+    return ceph_cfg.cephfs_del(fs_name, **_cluster_args(kwargs))
+
+
+def stats(reset=False):
+    '''
+    Get the call statistics of this module
+
+    CLI Example:
+
+    .. code-block:: bash
+
+        salt '*' ceph_cfg.stats reset=True
+
+    Notes:
+    Statistics are recorded in the minion process when the
+    "ceph_cfg.instrument" option is set in the minion config, grains or
+    pillar. Calls slower than the "ceph_cfg.slow_call_threshold" option in
+    seconds fire a "ceph_cfg/slow_call" event.
+
+    reset
+        Clear the statistics after returning them.
+
+    Returns a dictionary by function name with the number of calls and
+    errors, the total and maximum time in seconds, and the count of calls
+    by argument names, device and cluster name.
+    '''
+    with _STATS_LOCK:
+        output = copy.deepcopy(_STATS)
+        if reset:
+            _STATS.clear()
+    return output
+
+
+def _metrics_totals_path():
+    '''
+    Utility function: Path of the statistics totals of all processes
+    '''
+    cachedir = __opts__.get('cachedir')
+    if not cachedir:
+        return None
+    return os.path.join(cachedir, 'ceph_cfg', _METRICS_FILE)
+
+
+@contextlib.contextmanager
+def _metrics_lock(path):
+    '''
+    Utility function: Hold the lock on the statistics totals
+    '''
+    lock_path = os.path.join(os.path.dirname(path), _METRICS_LOCK_FILE)
+    if not os.path.isdir(os.path.dirname(lock_path)):
+        os.makedirs(os.path.dirname(lock_path))
+    with open(lock_path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _metrics_load(path):
+    '''
+    Utility function: Read the statistics totals
+    '''
+    if not os.path.isfile(path):
+        return {}
+    try:
+        with open(path) as totals_file:
+            return json.load(totals_file)
+    except (IOError, OSError, ValueError) as err:
+        log.warning("Ignoring metrics totals {0}:{1}".format(path, err))
+        return {}
+
+
+def _metrics_flush():
+    '''
+    Utility function: Add the pending statistics of this process to totals
+
+    Salt runs every job in its own process, so each process adds its
+    statistics and status results to the totals kept under the minion
+    cache dir, which metrics_export renders.
+    '''
+    path = _metrics_totals_path()
+    if path is None:
+        return
+    with _STATS_LOCK:
+        if not _STATS_PENDING and not _STATS_STATUS:
+            return
+        pending = {'functions': dict(_STATS_PENDING), 'status': dict(_STATS_STATUS)}
+        _STATS_PENDING.clear()
+        _STATS_STATUS.clear()
+    try:
+        with _metrics_lock(path):
+            totals = _metrics_merge(_metrics_load(path), pending)
+            _write_atomic(path, json.dumps(totals))
+    except (IOError, OSError) as err:
+        log.warning("Failed writing metrics totals {0}:{1}".format(path, err))
+
+
+def _metrics_reset():
+    '''
+    Utility function: Drop the statistics inherited by a forked process
+
+    The parent process adds them to the totals itself, and the call it
+    was running when it forked never finishes in the child.
+    '''
+    with _STATS_LOCK:
+        _STATS_PENDING.clear()
+        _STATS_STATUS.clear()
+        _STATS_ACTIVE[0] = 0
+
+
+def _metrics_merge(totals, pending):
+    '''
+    Utility function: Add pending statistics to totals
+    '''
+    functions = totals.setdefault('functions', {})
+    for name, entry in pending['functions'].items():
+        total = functions.setdefault(name, {
+            'calls': 0,
+            'errors': 0,
+            'time_total': 0.0,
+            'buckets': [0] * len(_STATS_BUCKETS)
+        })
+        for field in ('calls', 'errors', 'time_total'):
+            total[field] += entry[field]
+        total['buckets'] = [left + right for left, right in zip(total['buckets'], entry['buckets'])]
+    totals.setdefault('status', {}).update(pending['status'])
+    return totals
+
+
+def _metrics_label(value):
+    '''
+    Utility function: Escape a prometheus label value
+    '''
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _metrics_render(totals):
+    '''
+    Utility function: Render totals in the prometheus text format
+    '''
+    lines = [
+        '# HELP ceph_cfg_calls_total Calls of ceph_cfg execution functions.',
+        '# TYPE ceph_cfg_calls_total counter'
+    ]
+    functions = totals.get('functions', {})
+    for name in sorted(functions):
+        lines.append('ceph_cfg_calls_total{{function="{0}"}} {1}'.format(name, functions[name]['calls']))
+    lines.extend([
+        '# HELP ceph_cfg_errors_total Failed calls of ceph_cfg execution functions.',
+        '# TYPE ceph_cfg_errors_total counter'
+    ])
+    for name in sorted(functions):
+        lines.append('ceph_cfg_errors_total{{function="{0}"}} {1}'.format(name, functions[name]['errors']))
+    lines.extend([
+        '# HELP ceph_cfg_call_duration_seconds Duration of ceph_cfg execution functions.',
+        '# TYPE ceph_cfg_call_duration_seconds histogram'
+    ])
+    for name in sorted(functions):
+        total = functions[name]
+        cumulative = 0
+        for bound, count in zip(_STATS_BUCKETS, total['buckets']):
+            cumulative += count
+            lines.append('ceph_cfg_call_duration_seconds_bucket{{function="{0}",le="{1}"}} {2}'.format(
+                name, bound, cumulative))
+        lines.append('ceph_cfg_call_duration_seconds_bucket{{function="{0}",le="+Inf"}} {1}'.format(
+            name, total['calls']))
+        lines.append('ceph_cfg_call_duration_seconds_sum{{function="{0}"}} {1}'.format(name, total['time_total']))
+        lines.append('ceph_cfg_call_duration_seconds_count{{function="{0}"}} {1}'.format(name, total['calls']))
+    status = [json.loads(key) + [value] for key, value in sorted(totals.get('status', {}).items())]
+    lines.extend([
+        '# HELP ceph_cfg_cluster_health Last cluster health seen by cluster_status.',
+        '# TYPE ceph_cfg_cluster_health gauge'
+    ])
+    for name, cluster, _, value in status:
+        if name == 'cluster_status' and value['value'] is not None:
+            lines.append('ceph_cfg_cluster_health{{cluster="{0}",status="{1}"}} 1'.format(
+                _metrics_label(cluster), _metrics_label(value['value'])))
+    lines.extend([
+        '# HELP ceph_cfg_quorum Last quorum result seen by cluster_quorum and mon_quorum.',
+        '# TYPE ceph_cfg_quorum gauge'
+    ])
+    for name, cluster, mon, value in status:
+        if name != 'cluster_status':
+            lines.append('ceph_cfg_quorum{{cluster="{0}",mon="{1}"}} {2}'.format(
+                _metrics_label(cluster), _metrics_label(mon or ''), int(value['value'])))
+    lines.extend([
+        '# HELP ceph_cfg_status_timestamp_seconds Time of the last status result.',
+        '# TYPE ceph_cfg_status_timestamp_seconds gauge'
+    ])
+    for name, cluster, mon, value in status:
+        lines.append('ceph_cfg_status_timestamp_seconds{{function="{0}",cluster="{1}",mon="{2}"}} {3}'.format(
+            name, _metrics_label(cluster), _metrics_label(mon or ''), value['timestamp']))
+    return '\n'.join(lines) + '\n'
+
+
+def _metrics_schedule(interval, path):
+    '''
+    Utility function: Schedule metrics_export every interval seconds
+    '''
+    interval = int(interval)
+    scheduled = __salt__['schedule.list'](return_yaml=False) or {}
+    job = scheduled.get(_METRICS_SCHEDULE)
+    if job is not None and job.get('seconds') == interval and job.get('kwargs', {}).get('path') == path:
+        return False
+    if job is not None:
+        __salt__['schedule.delete'](_METRICS_SCHEDULE)
+    __salt__['schedule.add'](
+        _METRICS_SCHEDULE,
+        function='ceph_cfg.metrics_export',
+        seconds=interval,
+        job_kwargs={'path': path})
+    return True
+
+
+def metrics_export(path=None, interval=None):
+    '''
+    Write the module statistics to a prometheus textfile collector file
+
+    CLI Example:
+
+    .. code-block:: bash
+
+        salt '*' ceph_cfg.metrics_export \\
+                'path'='/var/lib/node_exporter/textfile_collector/ceph_cfg.prom' \\
+                'interval'='60'
+
+    Notes:
+    Writes call counts, error counts and call duration histograms by
+    function, and the last cluster health and quorum results, without
+    querying the cluster. Statistics are recorded when the
+    "ceph_cfg.instrument" option is set. Every job adds its statistics to
+    totals kept under the minion cache dir, which this renders, so a
+    scheduled export includes the calls of all jobs.
+
+    path
+        File to replace. Defaults to the "ceph_cfg.metrics_path" option or
+        /var/lib/node_exporter/textfile_collector/ceph_cfg.prom
+
+    interval
+        Also schedule this function to run every interval seconds.
+
+    Returns the path written.
+    '''
+    if path is None:
+        path = _option('metrics_path', _DEFAULT_METRICS_PATH)
+    totals = {}
+    totals_path = _metrics_totals_path()
+    if totals_path is not None:
+        with _metrics_lock(totals_path):
+            totals = _metrics_load(totals_path)
+    _write_atomic(path, _metrics_render(totals), mode=0o644)
+    if interval is not None:
+        _metrics_schedule(interval, path)
+    return path
+
+
+def _job_dir():
+    '''
+    Utility function: Directory of the background job records
+    '''
+    cachedir = __opts__.get('cachedir')
+    if not cachedir:
+        raise CommandExecutionError("No minion cachedir to record jobs in")
+    return os.path.join(cachedir, 'ceph_cfg', 'jobs')
+
+
+def _job_path(handle):
+    '''
+    Utility function: Path of a background job record
+    '''
+    if not handle or os.path.basename(str(handle)) != str(handle):
+        raise CommandExecutionError("Invalid job handle:{0}".format(handle))
+    return os.path.join(_job_dir(), '{0}.json'.format(handle))
+
+
+def _job_read(handle):
+    '''
+    Utility function: Read a background job record
+    '''
+    path = _job_path(handle)
+    try:
+        with open(path) as job_file:
+            return json.load(job_file)
+    except (IOError, OSError, ValueError):
+        raise CommandExecutionError("Unknown job handle:{0}".format(handle))
+
+
+def _job_write(record):
+    '''
+    Utility function: Write a background job record
+    '''
+    try:
+        content = json.dumps(record)
+    except (TypeError, ValueError):
+        record = dict(record, **{'return': repr(record.get('return'))})
+        content = json.dumps(record)
+    _write_atomic(_job_path(record['handle']), content)
+
+
+def _job_prune():
+    '''
+    Utility function: Remove records of jobs finished long ago
+    '''
+    job_dir = _job_dir()
+    if not os.path.isdir(job_dir):
+        return
+    for name in os.listdir(job_dir):
+        path = os.path.join(job_dir, name)
+        if time.time() - (_mtime(path) or time.time()) > _JOB_RETENTION:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _job_run(record):
+    '''
+    Utility function: Run a background job and record its result
+
+    The job process ends with os._exit, so the statistics of the job are
+    added to the totals here.
+    '''
+    record['pid'] = os.getpid()
+    _metrics_reset()
+    result = _timed_call(lambda params: globals()[record['fun']](**params), record['kwargs'])
+    _metrics_flush()
+    record.update(result)
+    record['state'] = 'done' if result['result'] else 'failed'
+    record['end'] = time.time()
+    _job_write(record)
+    if 'event.send' in __salt__:
+        __salt__['event.send']('ceph_cfg/job/{0}/complete'.format(record['handle']), {
+            'handle': record['handle'],
+            'fun': record['fun'],
+            'state': record['state'],
+            'duration': record['duration']
+        })
+
+
+def _job_close_fds(keep):
+    '''
+    Utility function: Close the descriptors inherited from the minion
+
+    Standard input and output go to /dev/null, and all other descriptors
+    apart from keep, such as ZeroMQ sockets and log files, are closed.
+    '''
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for std_fd in (0, 1, 2):
+        os.dup2(devnull, std_fd)
+    try:
+        max_fd = os.sysconf('SC_OPEN_MAX')
+    except (AttributeError, ValueError):
+        max_fd = 1024
+    start = 3
+    for fd in sorted(keep):
+        os.closerange(start, fd)
+        start = fd + 1
+    os.closerange(start, max_fd)
+
+
+def _job_spawn(record):
+    '''
+    Utility function: Run a background job in a detached process
+
+    The job process is detached so it outlives the salt job process. Its
+    pid is passed back over a pipe and recorded before the job runs, so a
+    job process dying early is reported as lost.
+    '''
+    pid_read, pid_write = os.pipe()
+    go_read, go_write = os.pipe()
+    pid = os.fork()
+    if pid > 0:
+        os.close(pid_write)
+        os.close(go_read)
+        try:
+            with os.fdopen(pid_read) as pid_file:
+                job_pid = pid_file.read().strip()
+            os.waitpid(pid, 0)
+            if job_pid:
+                record['pid'] = int(job_pid)
+            else:
+                record.update({
+                    'state': 'failed',
+                    'comment': 'job process did not start',
+                    'end': time.time()
+                })
+            _job_write(record)
+        finally:
+            os.close(go_write)
+        return
+    try:
+        os.close(pid_read)
+        os.close(go_write)
+        os.setsid()
+        if os.fork() > 0:
+            os._exit(0)
+        _job_close_fds([pid_write, go_read])
+        os.write(pid_write, str(os.getpid()).encode('ascii'))
+        os.close(pid_write)
+        # Wait for the pid to be recorded.
+        os.read(go_read, 1)
+        os.close(go_read)
+        _job_run(record)
+    except Exception as err:  # pylint: disable=broad-except
+        log.error("Background job {0} failed:{1}".format(record['handle'], err))
+    finally:
+        os._exit(0)
+
+
+def _pid_alive(pid):
+    '''
+    Utility function: Check whether a process exists
+    '''
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+def job_start(fun, **kwargs):
+    '''
+    Start a long running function in the background
+
+    CLI Example:
+
+    .. code-block:: bash
+
+        salt '*' ceph_cfg.job_start osd_prepare \\
+                'osd_dev'='/dev/vdc' \\
+                'cluster_name'='ceph'
+    Notes:
+    Returns immediately so the salt job does not time out. A
+    "ceph_cfg/job/<handle>/complete" event is fired when the function
+    finishes.
+
+    fun
+        Required paramter
+        Function to run. Can be set to:
+            mon_create, osd_prepare, osd_activate, osd_prepare_many,
+            osd_activate_many, rgw_create, mds_create, zap_many
+
+    All other arguments are passed to the function.
+
+    Returns the job handle to pass to job_status and job_wait.
+    '''
+    if fun not in _JOB_FUNCTIONS:
+        raise CommandExecutionError("Invalid fun:{0}".format(fun))
+    _job_prune()
+    record = {
+        'handle': uuid.uuid4().hex,
+        'fun': fun,
+        'kwargs': kwargs,
+        'state': 'running',
+        'pid': None,
+        'start': time.time()
+    }
+    _job_write(record)
+    _job_spawn(record)
+    return record['handle']
+
+
+def job_status(handle):
+    '''
+    Get the status of a background job
+
+    CLI Example:
+
+    .. code-block:: bash
+
+        salt '*' ceph_cfg.job_status 5b6ff5fd6d0e4f3c8a0a1c9e7f1f8a6e
+
+    Notes:
+
+    handle
+        Required paramter
+        The handle returned by job_start.
+
+    Returns the job record with "state" set to one of "running", "done",
+    "failed" or "lost" if the job process ended without a result. Finished
+    jobs include the "return" value or failure "comment" and the
+    "duration" in seconds.
+    '''
+    record = _job_read(handle)
+    if record['state'] == 'running' and record['pid'] is not None and not _pid_alive(record['pid']):
+        # The job process may have finished since the record was read.
+        record = _job_read(handle)
+        if record['state'] == 'running':
+            record['state'] = 'lost'
+    return record
+
+
+def job_wait(handle, timeout=None, interval=1):
+    '''
+    Wait for a background job to finish
+
+    CLI Example:
+
+    .. code-block:: bash
+
+        salt '*' ceph_cfg.job_wait 5b6ff5fd6d0e4f3c8a0a1c9e7f1f8a6e timeout=600
+
+    Notes:
+
+    handle
+        Required paramter
+        The handle returned by job_start.
+
+    timeout
+        Maximum time in seconds to wait. Defaults to waiting until the job
+        finishes.
+
+    interval
+        Delay in seconds between checks. Defaults to 1.
+
+    Returns the job record as job_status does, "state" is "running" if the
+    timeout expired.
+    '''
+    deadline = None if timeout is None else time.time() + float(timeout)
+    while True:
+        record = job_status(handle)
+        if record['state'] != 'running':
+            return record
+        if deadline is not None and time.time() >= deadline:
+            return record
+        delay = float(interval)
+        if deadline is not None:
+            delay = min(delay, max(deadline - time.time(), 0))
+        time.sleep(delay)
+
+
+def _cephfs_names(listing):
+    '''
+    Utility function: Get the file system names from a cephfs_list result
+    '''
+    if isinstance(listing, dict):
+        return set(listing)
+    names = set()
+    for item in listing or []:
+        if isinstance(item, dict):
+            names.add(item.get('name'))
+        else:
+            names.add(item)
+    names.discard(None)
+    return names
+
+
+def _cephfs_pools(listing):
+    '''
+    Utility function: Get the pool names used by a cephfs_list result
+    '''
+    items = listing.values() if isinstance(listing, dict) else listing or []
+    pools = set()
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        pools.add(item.get('metadata_pool'))
+        pools.update(item.get('data_pools') or [])
+    pools.discard(None)
+    return pools
+
+
+def _reconcile_gather(desired, max_workers, kwargs):
+    '''
+    Utility function: Read the current state for the desired sections
+
+    The reads are independent and run concurrently.
+    '''
+    readers = []
+    if 'mons' in desired:
+        readers.append(('mons', lambda: mon_list(**kwargs)))
+    if 'keyrings' in desired:
+        readers.append(('keyrings', lambda: _auth_index(**kwargs)[1]))
+    if 'pools' in desired or 'cephfs' in desired:
+        readers.append(('pools', lambda: _pool_names(pool_list(**kwargs))))
+    if 'osds' in desired:
+        devs = [params['osd_dev'] for params in _item_specs(desired['osds'], 'osd_dev', 'device')]
+        readers.append(('osds', lambda: osd_dev_status(devs=devs)))
+    if 'cephfs' in desired or ('pools' in desired and desired.get('prune_pools')):
+        readers.append(('cephfs', lambda: cephfs_list(**kwargs)))
+    if desired.get('rgw_pools'):
+        readers.append(('rgw_pools', lambda: rgw_pools_missing(**kwargs)))
+    results = _run_many(lambda reader: reader[1](), readers, max_workers)
+    current = {}
+    for reader, result in zip(readers, results):
+        if not result['result']:
+            raise CommandExecutionError("Reading {0} failed:{1}".format(reader[0], result['comment']))
+        current[reader[0]] = result['return']
+    return current
+
+
+def _reconcile_plan(desired, current, kwargs):
+    '''
+    Utility function: Plan the actions to reach the desired state
+
+    Returns a list of actions, each with the function and arguments to call
+    and the ids of the actions it requires.
+    '''
+    plan = []
+
+    def _add(action_id, fun, args, params, requires):
+        plan.append({
+            'id': action_id,
+            'fun': fun,
+            'args': list(args),
+            'kwargs': dict(kwargs, **params),
+            'requires': sorted(requires)
+        })
+        return action_id
+
+    mon_ids = set()
+    for mon_name in desired.get('mons', []):
+        if mon_name not in current['mons']:
+            mon_ids.add(_add('mon_create:{0}'.format(mon_name), 'mon_create', [], {'mon_name': mon_name}, []))
+    auth_ids = {}
+    for keyring_type in desired.get('keyrings', []):
+        if keyring_type not in _KEYRING_AUTH_TYPES:
+            raise CommandExecutionError("Invalid keyring_type:{0}".format(keyring_type))
+        if _KEYRING_ENTITIES[keyring_type] not in current['keyrings']:
+            auth_ids[keyring_type] = _add(
+                'keyring_auth_add:{0}'.format(keyring_type),
+                'keyring_auth_add', [], {'keyring_type': keyring_type}, mon_ids)
+    pool_ids = {}
+    fs_specs = _item_specs(desired.get('cephfs', []), 'name', 'filesystem')
+    creates, deletes = _pool_plan(desired.get('pools', []), current.get('pools', []),
+                                  'pools' in desired and desired.get('prune_pools', False))
+    # Never prune the pools of a desired or existing file system.
+    fs_pools = _cephfs_pools(current.get('cephfs'))
+    fs_pools.update(params.get(pool_key) for params in fs_specs for pool_key in ('pool_data', 'pool_metadata'))
+    for params in creates:
+        params = dict(params)
+        pool_name = params.pop('name')
+        pool_ids[pool_name] = _add('pool_add:{0}'.format(pool_name), 'pool_add', [pool_name], params, mon_ids)
+    for pool_name in deletes:
+        if pool_name not in fs_pools:
+            _add('pool_del:{0}'.format(pool_name), 'pool_del', [pool_name], {}, mon_ids)
+    if desired.get('rgw_pools') and current['rgw_pools']:
+        _add('rgw_pools_create', 'rgw_pools_create', [], {}, mon_ids)
+    for params in _item_specs(desired.get('osds', []), 'osd_dev', 'device'):
+        osd_dev = params['osd_dev']
+        status = current['osds'][osd_dev]
+        if status['active']:
+            continue
+        requires = set(mon_ids)
+        if not status['prepared']:
+            if 'osd' in auth_ids:
+                requires.add(auth_ids['osd'])
+            requires = [_add('osd_prepare:{0}'.format(osd_dev), 'osd_prepare', [], params, requires)]
+        _add('osd_activate:{0}'.format(osd_dev), 'osd_activate', [], {'osd_dev': osd_dev}, requires)
+    existing = _cephfs_names(current.get('cephfs'))
+    for params in fs_specs:
+        params = dict(params)
+        fs_name = params.pop('name')
+        if fs_name in existing:
+            continue
+        requires = set(mon_ids)
+        for pool_key in ('pool_data', 'pool_metadata'):
+            if params.get(pool_key) in pool_ids:
+                requires.add(pool_ids[params[pool_key]])
+        _add('cephfs_add:{0}'.format(fs_name), 'cephfs_add', [fs_name], params, requires)
+    return plan
+
+
+def _reconcile_apply(plan, max_workers):
+    '''
+    Utility function: Run planned actions in dependency order
+
+    Actions whose requirements are met run concurrently. Actions requiring
+    a failed action are not run.
+    '''
+    results = {}
+    pending = list(plan)
+    while pending:
+        ready = [action for action in pending if all(req in results for req in action['requires'])]
+        if not ready:
+            raise CommandExecutionError("Plan has a dependency cycle:{0}".format(
+                [action['id'] for action in pending]))
+        runnable = []
+        for action in ready:
+            failed = [req for req in action['requires'] if not results[req]['result']]
+            if failed:
+                results[action['id']] = {
+                    'result': False,
+                    'comment': "required action failed:{0}".format(', '.join(failed)),
+                    'duration': 0
+                }
+            else:
+                runnable.append(action)
+
+        def _run(action):
+            return globals()[action['fun']](*action['args'], **action['kwargs'])
+
+        for action, result in zip(runnable, _run_many(_run, runnable, max_workers)):
+            results[action['id']] = result
+        pending = [action for action in pending if action['id'] not in results]
+    return results
+
+
+def cluster_reconcile(desired=None, plan_only=False, max_workers=None, **kwargs):
+    '''
+    Make the cluster match a desired state
+
+    CLI Example:
+
+    .. code-block:: bash
+
+        salt '*' ceph_cfg.cluster_reconcile \\
+                'desired'='{"mons": ["mon01"], "keyrings": ["osd"], "pools": ["rbd"], "osds": ["/dev/vdb"]}' \\
+                'plan_only'='True' \\
+                'cluster_name'='ceph' \\
+                'cluster_uuid'='cluster_uuid'
+    Notes:
+    Reads the current state once, plans the actions needed to reach the
+    desired state, and runs actions which do not depend on each other
+    concurrently. A converged cluster only costs the reads.
+
+    desired
+        Required paramter
+        Dictionary of the desired state. All keys are optional:
+
+        mons
+            List of mon names to create on this node.
+
+        keyrings
+            List of keyring types to authorise. Can be set to:
+                osd, rgw, mds
+
+        pools
+            List of pools, as for pool_apply.
+
+        prune_pools
+            Delete pools not in pools. Only used if pools is set, and
+            pools used by a desired or existing cephfs are never deleted.
+            Defaults to False.
+
+        rgw_pools
+            Create the rgw pools if missing.
+
+        osds
+            List of devices to prepare and activate, as for
+            osd_prepare_many. Prepared devices which are not active are
+            only activated.
+
+        cephfs
+            List of dictionaries with the cephfs "name", "pool_data" and
+            "pool_metadata".
+
+    plan_only
+        Only return the plan, do not change the cluster.
+
+    max_workers
+        Maximum number of actions run concurrently. Defaults to 8.
+
+    cluster_uuid
+        Set the cluster UUID. Defaults to value found in ceph config file.
+
+    cluster_name
+        Set the cluster name. Defaults to "ceph".
+
+    Returns a dictionary with the "plan", a list of actions with the ids
+    of the actions they require, and unless plan_only the "results" by
+    action id.
+    '''
+    if not isinstance(desired, dict):
+        raise CommandExecutionError("Invalid desired:{0}".format(desired))
+    current = _reconcile_gather(desired, max_workers, kwargs)
+    plan = _reconcile_plan(desired, current, kwargs)
+    if plan_only:
+        return {'plan': plan}
+    return {'plan': plan, 'results': _reconcile_apply(plan, max_workers)}
+
+
+def _misplaced_pct(status):
+    '''
+    Utility function: Get the percentage of misplaced objects from a status
+    '''
+    pgmap = status.get('pgmap', {}) if isinstance(status, dict) else {}
+    if 'misplaced_ratio' in pgmap:
+        return float(pgmap['misplaced_ratio']) * 100
+    if pgmap.get('misplaced_total'):
+        return 100.0 * pgmap.get('misplaced_objects', 0) / pgmap['misplaced_total']
+    return 0.0
+
+
+def _wait_for_misplaced(max_misplaced_pct, interval, deadline, kwargs):
+    '''
+    Utility function: Wait until misplaced objects are below a percentage
+
+    Returns False if the deadline passes first.
+    '''
+    params = dict(kwargs)
+    params['refresh'] = True
+    while True:
+        misplaced = _misplaced_pct(cluster_status(**params))
+        if misplaced <= max_misplaced_pct:
+            return True
+        remaining = None if deadline is None else deadline - time.time()
+        if remaining is not None and remaining <= 0:
+            return False
+        log.debug("Waiting for misplaced objects:{0:.2f}%".format(misplaced))
+        time.sleep(interval if remaining is None else min(remaining, interval))
+
+
+def _osd_reweights(osd_numbers, kwargs):
+    '''
+    Utility function: Get the current reweight of OSDs from the osd map
+    '''
+    dump = _mon_json('osd dump', cluster_name=kwargs.get('cluster_name'),
+                     cluster_uuid=kwargs.get('cluster_uuid'))
+    current = dict((osd['osd'], float(osd['weight'])) for osd in dump.get('osds', []))
+    missing = [osd_number for osd_number in osd_numbers if osd_number not in current]
+    if missing:
+        raise CommandExecutionError("OSDs not found:{0}".format(missing))
+    return dict((osd_number, current[osd_number]) for osd_number in osd_numbers)
+
+
+def osd_drain(osd_numbers=None,
+              step=0.1,
+              max_misplaced_pct=5,
+              target_weight=0,
+              max_workers=None,
+              interval=10,
+              timeout=None,
+              **kwargs):
+    '''
+    Drain OSDs by lowering their weight in steps
+
+    CLI Example:
+
+    .. code-block:: bash
+
+        salt '*' ceph_cfg.osd_drain \\
+                'osd_numbers'='[12, 13, 14]' \\
+                'step'='0.1' \\
+                'max_misplaced_pct'='5' \\
+                'cluster_name'='ceph'
+    Notes:
+    Setting an OSD weight to 0 in one step rebalances at full speed and
+    hurts client latency. This reads the current weight of each OSD and
+    lowers it by step at a time, never raising a weight, and
+    before each step waits until the misplaced objects reported by
+    cluster_status are at or below max_misplaced_pct. Each step is applied
+    with osd_reweight_many, followed by a wait of interval seconds so the
+    placement group stats catch up with the new osd map.
+
+    osd_numbers
+        Required paramter
+        List of OSD numbers to drain.
+
+    step
+        Weight removed per step. Defaults to 0.1.
+
+    max_misplaced_pct
+        Percentage of misplaced objects allowed before the next step.
+        Defaults to 5.
+
+    target_weight
+        Weight to drain the OSDs to. Defaults to 0.
+
+    max_workers
+        Maximum number of OSDs drained at the same time. Further OSDs are
+        drained once these reach target_weight. Defaults to 8.
+
+    interval
+        Seconds to wait after each step and between checks of the cluster
+        status. Defaults to 10.
+
+    timeout
+        Maximum seconds to drain for. Defaults to no limit.
+
+    cluster_uuid
+        Set the cluster UUID. Defaults to value found in ceph config file.
+
+    cluster_name
+        Set the cluster name. Defaults to "ceph".
+
+    Returns a dictionary with the "weights" reached by OSD number, the
+    number of "steps", whether draining is "complete" and the "elapsed"
+    time in seconds.
+    '''
+    if not osd_numbers:
+        raise CommandExecutionError("Required paramter 'osd_numbers' not set")
+    step = float(step)
+    target_weight = float(target_weight)
+    if step <= 0:
+        raise CommandExecutionError("Invalid step:{0}".format(step))
+    if not 0 <= target_weight <= 1:
+        raise CommandExecutionError("Invalid weight:{0}".format(target_weight))
+    workers = _max_workers(max_workers)
+    start = time.time()
+    deadline = None if timeout is None else start + float(timeout)
+    weights = _osd_reweights([int(osd_number) for osd_number in osd_numbers], kwargs)
+    steps = 0
+    complete = True
+    pending = sorted(weights)
+    while pending:
+        draining = pending[:workers]
+        while any(weights[osd_number] > target_weight for osd_number in draining):
+            if not _wait_for_misplaced(float(max_misplaced_pct), float(interval), deadline, kwargs):
+                complete = False
+                break
+            changes = dict(
+                (osd_number, round(max(target_weight, weights[osd_number] - step), 4))
+                for osd_number in draining if weights[osd_number] > target_weight)
+            results = osd_reweight_many(weights=changes, max_workers=workers, **kwargs)
+            for osd_number, result in results.items():
+                if not result['result']:
+                    raise CommandExecutionError("Reweight of osd {0} failed:{1}".format(osd_number, result['comment']))
+                weights[osd_number] = result['weight']
+            steps += 1
+            # The misplaced objects only show once the placement group
+            # stats catch up with the new osd map.
+            remaining = None if deadline is None else deadline - time.time()
+            time.sleep(float(interval) if remaining is None else max(min(remaining, float(interval)), 0))
+        if not complete:
+            break
+        pending = pending[workers:]
+    return {
+        'weights': weights,
+        'steps': steps,
+        'complete': complete,
+        'elapsed': round(time.time() - start, 3)
+    }
+
+
+def mine_status(**kwargs):
+    '''
+    Get the cluster status to publish to the salt mine
+
+    CLI Example:
+
+    .. code-block:: bash
+
+        salt '*' ceph_cfg.mine_status 'cluster_name'='ceph'
+
+    Notes:
+    Configure this as a mine function on a few mon or admin nodes, for
+    example in pillar:
+
+    .. code-block:: yaml
+
+        mine_functions:
+          ceph_cfg.mine_status: []
+
+    and set the "ceph_cfg.status_source" option to "mine" on the other
+    nodes. Their cluster_status, cluster_quorum and the quorum state then
+    read the published status, found on the minions matching the
+    "ceph_cfg.mine_target" option and "ceph_cfg.mine_target_type" option,
+    if it is not older than the "ceph_cfg.mine_max_age" option in seconds.
+    Older data is ignored and the cluster is queried. This keeps the load
+    on the mon daemons independent of the number of minions.
+
+    The mine is only updated every "mine_interval" minutes, so set the
+    "mine_interval" option on the publishing minions to how stale the
+    status may be, for example:
+
+    .. code-block:: yaml
+
+        mine_interval: 1
+
+    The "ceph_cfg.mine_max_age" option defaults to twice the
+    "mine_interval" option of the reading minion, so set the same
+    "mine_interval" on every minion, or set "ceph_cfg.mine_max_age".
+
+    mon_name
+        Also publish the mon_quorum of this mon.
+
+    cluster_uuid
+        Set the cluster UUID. Defaults to value found in ceph config file.
+
+    cluster_name
+        Set the cluster name. Defaults to "ceph".
+
+    Returns a dictionary with the "cluster" name and uuid, the
+    "timestamp", "cluster_status", "cluster_quorum", a "pools" summary with
+    the "count" and "names" of pools, and "mon_quorum" if mon_name is set.
+    '''
+    params = dict(kwargs)
+    params['refresh'] = True
+    mon_name = params.pop('mon_name', None)
+    output = {
+        'cluster': list(_cluster_key(kwargs.get('cluster_name'), kwargs.get('cluster_uuid'))),
+        'timestamp': time.time(),
+        'cluster_status': cluster_status(**params),
+        'cluster_quorum': cluster_quorum(**params)
+    }
+    params.pop('refresh')
+    names = sorted(_pool_names(pool_list(**params)))
+    output['pools'] = {'count': len(names), 'names': names}
+    if mon_name is not None:
+        output['mon_quorum'] = mon_quorum(mon_name=mon_name, refresh=True, **params)
+    return output
+
+# Must follow the definition of every public function.
+_instrument_module()
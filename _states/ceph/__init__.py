@@ -8,6 +8,7 @@ Manage ceph with salt.
 from __future__ import absolute_import
 import logging
 import json
+import re
 
 # Import Salt Libs
 from salt.exceptions import CommandExecutionError, CommandNotFoundError
@@ -15,6 +16,13 @@ from salt.exceptions import CommandExecutionError, CommandNotFoundError
 
 log = logging.getLogger(__name__)
 
+# The cephx entity each authorisable keyring type adds.
+_KEYRING_ENTITIES = {
+    'osd': 'client.bootstrap-osd',
+    'rgw': 'client.bootstrap-rgw',
+    'mds': 'client.bootstrap-mds'
+}
+
 
 def _unchanged(name, msg):
     '''
@@ -51,6 +59,16 @@ def _ordereddict2dict(input_ordered_dict):
     return json.loads(json.dumps(input_ordered_dict))
 
 
+def _keyring_secret(key_content):
+    '''
+    Utility function: Get the secret from keyring content
+    '''
+    match = re.search(r'key\s*=\s*(\S+)', str(key_content))
+    if match is None:
+        return None
+    return match.group(1)
+
+
 def quorum(name, **kwargs):
     '''
     Quorum state
@@ -59,6 +77,11 @@ def quorum(name, **kwargs):
     cluster but can be used in formula as a dependency for many cluster
     operations.
 
+    The quorum result is shared with the ceph_cfg status functions for
+    "ceph_cfg.status_ttl" seconds. With the "ceph_cfg.status_source" option
+    set to "mine" the quorum published by ceph_cfg.mine_status is used
+    while fresh. Set refresh to True to always query the mon daemons.
+
     Example usage in sls file:
 
     . code-block:: yaml
@@ -81,3 +104,368 @@ def quorum(name, **kwargs):
     if cluster_quorum:
         return _unchanged(name, "cluster is quorum")
     return _error(name, "cluster is not quorum")
+
+
+def wait_for_quorum(name, timeout=300, interval=1, max_interval=30, **kwargs):
+    '''
+    Wait for quorum state
+
+    This state waits for the mon daemons to be in quorum, polling with
+    exponential backoff up to timeout seconds. It does not alter the
+    cluster. The time taken to reach quorum is reported in the changes.
+
+    Example usage in sls file:
+
+    . code-block:: yaml
+
+        quorum:
+          sesceph.wait_for_quorum:
+            - timeout: 300
+            - require:
+              - sesceph: mon_running
+    '''
+    paramters = _ordereddict2dict(kwargs)
+    if paramters is None:
+        return _error(name, "Invalid paramters:%s")
+
+    if __opts__['test']:
+        return _test(name, "cluster quorum")
+    try:
+        waited = __salt__['ceph_cfg.wait_for_quorum'](
+            timeout=timeout,
+            interval=interval,
+            max_interval=max_interval,
+            **paramters)
+    except (CommandExecutionError, CommandNotFoundError) as err:
+        return _error(name, err.strerror)
+    if not waited['quorum']:
+        return _error(name, "cluster is not quorum after {0} seconds".format(waited['elapsed']))
+    if waited['attempts'] == 1:
+        return _unchanged(name, "cluster is quorum")
+    return _changed(
+        name,
+        "cluster is quorum",
+        time_to_quorum=waited['elapsed'],
+        attempts=waited['attempts'])
+
+
+def keyring_present(name, keyring_type, secret=None, **kwargs):
+    '''
+    Keyring present state
+
+    This state ensures a keyring is saved on the node. If a secret is given
+    and the saved keyring has a different secret, the keyring is replaced.
+    The keyring is only saved when missing or different.
+
+    Example usage in sls file:
+
+    . code-block:: yaml
+
+        keyring_osd:
+          sesceph.keyring_present:
+            - keyring_type: osd
+            - secret: 'AQCxU6dWKJzuEBAAjh0WSiThjl+Ruvj3QCsDDQ=='
+    '''
+    paramters = _ordereddict2dict(kwargs)
+    if paramters is None:
+        return _error(name, "Invalid paramters:%s")
+    paramters['keyring_type'] = keyring_type
+    try:
+        present = __salt__['ceph_cfg.keyring_present'](**paramters)
+        if present:
+            if secret is None:
+                return _unchanged(name, "keyring {0} is present".format(keyring_type))
+            current = _keyring_secret(__salt__['ceph_cfg.keyring_create'](**paramters))
+            if current == secret:
+                return _unchanged(name, "keyring {0} is present".format(keyring_type))
+        if __opts__['test']:
+            return _test(name, "keyring {0} will be saved".format(keyring_type))
+        if present:
+            __salt__['ceph_cfg.keyring_purge'](**paramters)
+        if secret is not None:
+            paramters['secret'] = secret
+        __salt__['ceph_cfg.keyring_save'](**paramters)
+    except (CommandExecutionError, CommandNotFoundError) as err:
+        return _error(name, err.strerror)
+    changes = {'saved': keyring_type}
+    if present:
+        changes['replaced'] = True
+    return _changed(name, "keyring {0} saved".format(keyring_type), **changes)
+
+
+def keyring_absent(name, keyring_type, **kwargs):
+    '''
+    Keyring absent state
+
+    This state ensures a keyring is not saved on the node.
+
+    Example usage in sls file:
+
+    . code-block:: yaml
+
+        keyring_rgw:
+          sesceph.keyring_absent:
+            - keyring_type: rgw
+    '''
+    paramters = _ordereddict2dict(kwargs)
+    if paramters is None:
+        return _error(name, "Invalid paramters:%s")
+    paramters['keyring_type'] = keyring_type
+    try:
+        present = __salt__['ceph_cfg.keyring_present'](**paramters)
+        if not present:
+            return _unchanged(name, "keyring {0} is absent".format(keyring_type))
+        if __opts__['test']:
+            return _test(name, "keyring {0} will be purged".format(keyring_type))
+        __salt__['ceph_cfg.keyring_purge'](**paramters)
+    except (CommandExecutionError, CommandNotFoundError) as err:
+        return _error(name, err.strerror)
+    return _changed(name, "keyring {0} purged".format(keyring_type), purged=keyring_type)
+
+
+def keyring_authorized(name, keyring_type, secret=None, **kwargs):
+    '''
+    Keyring authorized state
+
+    This state ensures the keyring saved on the node is in the clusters
+    authorised list. If a secret is given and the authorised entry has a
+    different secret, the entry is removed and added again from the saved
+    keyring. The authorised list is only changed when the entry is missing
+    or has a different secret. The caps of the entry are set by the
+    library and not managed by this state.
+
+    Example usage in sls file:
+
+    . code-block:: yaml
+
+        keyring_osd_auth:
+          sesceph.keyring_authorized:
+            - keyring_type: osd
+            - secret: 'AQCxU6dWKJzuEBAAjh0WSiThjl+Ruvj3QCsDDQ=='
+            - require:
+              - sesceph: keyring_osd
+              - sesceph: quorum
+    '''
+    paramters = _ordereddict2dict(kwargs)
+    if paramters is None:
+        return _error(name, "Invalid paramters:%s")
+    entity = _KEYRING_ENTITIES.get(keyring_type)
+    if entity is None:
+        return _error(name, "Invalid keyring_type:{0}".format(keyring_type))
+    paramters['keyring_type'] = keyring_type
+    try:
+        entry = __salt__['ceph_cfg.keyring_auth_get'](entity, **paramters)
+        differs = []
+        if entry is not None:
+            if secret is not None and entry.get('key') != secret:
+                differs.append('secret')
+            if not differs:
+                return _unchanged(name, "{0} is authorised".format(entity))
+        if __opts__['test']:
+            return _test(name, "{0} will be authorised".format(entity))
+        if entry is not None:
+            __salt__['ceph_cfg.keyring_auth_del'](**paramters)
+        __salt__['ceph_cfg.keyring_auth_add'](**paramters)
+    except (CommandExecutionError, CommandNotFoundError) as err:
+        return _error(name, err.strerror)
+    if differs:
+        return _changed(name, "{0} authorised".format(entity), replaced=differs)
+    return _changed(name, "{0} authorised".format(entity), added=entity)
+
+
+def pools_managed(name, pools, prune=False, **kwargs):
+    '''
+    Pools managed state
+
+    This state ensures the listed pools exist. Pools not listed are deleted
+    when prune is set. The pool list is read once and only the pools which
+    differ are created or deleted.
+
+    Example usage in sls file:
+
+    . code-block:: yaml
+
+        pools:
+          sesceph.pools_managed:
+            - pools:
+              - name: rbd
+                pg_num: 128
+              - images
+            - require:
+              - sesceph: quorum
+    '''
+    paramters = _ordereddict2dict(kwargs)
+    if paramters is None:
+        return _error(name, "Invalid paramters:%s")
+    try:
+        applied = __salt__['ceph_cfg.pool_apply'](
+            pools=_ordereddict2dict(pools),
+            prune=prune,
+            test=__opts__['test'],
+            **paramters)
+    except (CommandExecutionError, CommandNotFoundError) as err:
+        return _error(name, err.strerror)
+    if not applied['created'] and not applied['deleted']:
+        return _unchanged(name, "pools are in the desired state")
+    if __opts__['test']:
+        return _test(name, "pools will be created:{0} deleted:{1}".format(
+            sorted(applied['created']), sorted(applied['deleted'])))
+    failed = {}
+    for action in ('created', 'deleted'):
+        for pool_name, result in applied[action].items():
+            if not result['result']:
+                failed[pool_name] = result['comment']
+    changes = {
+        'created': sorted(pool_name for pool_name in applied['created'] if pool_name not in failed),
+        'deleted': sorted(pool_name for pool_name in applied['deleted'] if pool_name not in failed)
+    }
+    if failed:
+        ret = _error(name, "pools failed:{0}".format(failed))
+        ret['changes'] = changes
+        return ret
+    return _changed(name, "pools changed", **changes)
+
+
+def _osd_dev_status(osd_dev):
+    '''
+    Get the OSD status of a disk
+    '''
+    return __salt__['ceph_cfg.osd_dev_status'](devs=[osd_dev])[osd_dev]
+
+
+def osd_prepared(name, osd_dev=None, **kwargs):
+    '''
+    OSD prepared state
+
+    This state ensures a disk is prepared as an OSD. Disks with OSD
+    partitions are not prepared again. Arguments other than osd_dev are
+    passed to osd_prepare.
+
+    Example usage in sls file:
+
+    . code-block:: yaml
+
+        /dev/vdb:
+          sesceph.osd_prepared:
+            - journal_dev: auto
+            - require:
+              - sesceph: keyring_osd_authorized
+    '''
+    paramters = _ordereddict2dict(kwargs)
+    if paramters is None:
+        return _error(name, "Invalid paramters:%s")
+    paramters['osd_dev'] = osd_dev or name
+    try:
+        if _osd_dev_status(paramters['osd_dev'])['prepared']:
+            return _unchanged(name, "osd {0} is prepared".format(paramters['osd_dev']))
+        if __opts__['test']:
+            return _test(name, "osd {0} will be prepared".format(paramters['osd_dev']))
+        __salt__['ceph_cfg.osd_prepare'](**paramters)
+    except (CommandExecutionError, CommandNotFoundError) as err:
+        return _error(name, err.strerror)
+    return _changed(name, "osd {0} prepared".format(paramters['osd_dev']), prepared=paramters['osd_dev'])
+
+
+def osd_active(name, osd_dev=None, **kwargs):
+    '''
+    OSD active state
+
+    This state ensures a prepared OSD disk is active. Disks with a mounted
+    OSD partition are not activated again.
+
+    Example usage in sls file:
+
+    . code-block:: yaml
+
+        /dev/vdb:
+          sesceph.osd_active:
+            - require:
+              - sesceph: /dev/vdb
+    '''
+    paramters = _ordereddict2dict(kwargs)
+    if paramters is None:
+        return _error(name, "Invalid paramters:%s")
+    paramters['osd_dev'] = osd_dev or name
+    try:
+        status = _osd_dev_status(paramters['osd_dev'])
+        if status['active']:
+            return _unchanged(name, "osd {0} is active".format(paramters['osd_dev']))
+        if __opts__['test']:
+            return _test(name, "osd {0} will be activated".format(paramters['osd_dev']))
+        if not status['prepared']:
+            return _error(name, "osd {0} is not prepared".format(paramters['osd_dev']))
+        __salt__['ceph_cfg.osd_activate'](**paramters)
+    except (CommandExecutionError, CommandNotFoundError) as err:
+        return _error(name, err.strerror)
+    return _changed(name, "osd {0} activated".format(paramters['osd_dev']), activated=paramters['osd_dev'])
+
+
+def osds_managed(name, devices, activate=True, max_workers=None, **kwargs):
+    '''
+    OSDs managed state
+
+    This state ensures the listed disks are prepared and, unless activate
+    is False, active OSDs. The OSD status of all disks is read once and
+    only the disks which differ are prepared or activated, concurrently
+    up to max_workers.
+
+    Example usage in sls file:
+
+    . code-block:: yaml
+
+        osds:
+          sesceph.osds_managed:
+            - devices:
+              - /dev/vdb
+              - osd_dev: /dev/vdc
+                journal_dev: /dev/vdd
+            - require:
+              - sesceph: keyring_osd_authorized
+    '''
+    paramters = _ordereddict2dict(kwargs)
+    if paramters is None:
+        return _error(name, "Invalid paramters:%s")
+    devices = _ordereddict2dict(devices)
+    if not isinstance(devices, list):
+        return _error(name, "Invalid devices:{0}".format(devices))
+    specs = []
+    for device in devices:
+        spec = dict(device) if isinstance(device, dict) else {'osd_dev': device}
+        if not spec.get('osd_dev'):
+            return _error(name, "Invalid device:{0}".format(device))
+        specs.append(spec)
+    try:
+        status = __salt__['ceph_cfg.osd_dev_status'](devs=[spec['osd_dev'] for spec in specs])
+        prepare = [spec for spec in specs if not status[spec['osd_dev']]['prepared']]
+        inactive = []
+        if activate:
+            inactive = [spec['osd_dev'] for spec in specs if not status[spec['osd_dev']]['active']]
+        if not prepare and not inactive:
+            return _unchanged(name, "osds are in the desired state")
+        if __opts__['test']:
+            return _test(name, "osds will be prepared:{0} activated:{1}".format(
+                sorted(spec['osd_dev'] for spec in prepare), sorted(inactive)))
+        failed = {}
+        if prepare:
+            prepared = __salt__['ceph_cfg.osd_prepare_many'](
+                devices=prepare, max_workers=max_workers, **paramters)
+            for osd_dev, result in prepared.items():
+                if not result['result']:
+                    failed[osd_dev] = result['comment']
+        inactive = [osd_dev for osd_dev in inactive if osd_dev not in failed]
+        if inactive:
+            activated = __salt__['ceph_cfg.osd_activate_many'](devices=inactive, max_workers=max_workers)
+            for osd_dev, result in activated.items():
+                if not result['result']:
+                    failed[osd_dev] = result['comment']
+    except (CommandExecutionError, CommandNotFoundError) as err:
+        return _error(name, err.strerror)
+    changes = {
+        'prepared': sorted(spec['osd_dev'] for spec in prepare if spec['osd_dev'] not in failed),
+        'activated': sorted(osd_dev for osd_dev in inactive if osd_dev not in failed)
+    }
+    if failed:
+        ret = _error(name, "osds failed:{0}".format(failed))
+        ret['changes'] = changes
+        return ret
+    return _changed(name, "osds changed", **changes)
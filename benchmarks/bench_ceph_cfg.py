@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Benchmark the ceph_cfg execution module and the ceph state module.
+
+Every public function of both modules is driven against the stand-in
+ceph_cfg and rados libraries in benchmarks/fake, with fake __salt__ and
+__opts__ dunders, and the ops/sec and p50/p99 latencies are reported.
+Set the ceph_cfg.rados option to False with --no-rados to run monitor
+commands through the fake ceph command line instead.
+
+Salt must be importable as the modules use salt.exceptions.
+
+Example:
+
+    python benchmarks/bench_ceph_cfg.py --latency 0.001 --iterations 50
+    python benchmarks/bench_ceph_cfg.py --filter 'osd_' --json after.json
+'''
+from __future__ import absolute_import, print_function
+import argparse
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+MODULE_PATH = os.path.join(ROOT_DIR, '_modules', 'ceph_cfg', '__init__.py')
+STATE_PATH = os.path.join(ROOT_DIR, '_states', 'ceph', '__init__.py')
+
+sys.path.insert(0, os.path.join(BENCH_DIR, 'fake'))
+import ceph_cfg as fake  # pylint: disable=wrong-import-position
+
+
+def load_source(name, path):
+    '''
+    Import a python file as a module
+    '''
+    try:
+        import importlib.util
+    except ImportError:
+        import imp
+        return imp.load_source(name, path)
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def fake_cmd_run_all(cmd, **kwargs):
+    '''
+    Run the ceph commands the module uses against the fake library
+    '''
+    if cmd[:1] == ['ceph']:
+        retcode, output, error = fake.mon_command(fake.mon_command_argv(cmd))
+        return {'retcode': -retcode, 'stdout': output.decode('utf-8'), 'stderr': error}
+    return {'retcode': 127, 'stdout': '', 'stderr': '{0}: command not found'.format(cmd[0])}
+
+
+def fake_salt(opts):
+    '''
+    Build the __salt__ functions the modules use outside of ceph_cfg
+    '''
+    return {
+        'cmd.run_all': fake_cmd_run_all,
+        'config.get': lambda key, default=None: opts.get(key, default),
+        'event.send': lambda tag, data=None, **kwargs: True,
+        'mine.get': lambda tgt, fun, tgt_type='glob': {}
+    }
+
+
+def load_modules(cachedir, use_rados=True):
+    '''
+    Load the execution and state modules with fake dunders
+    '''
+    opts = {'test': False, 'cachedir': cachedir, 'ceph_cfg.rados': use_rados}
+    module = load_source('salt_ceph_cfg', MODULE_PATH)
+    module.__opts__ = opts
+    module.__salt__ = fake_salt(opts)
+    module.__context__ = {}
+    states = load_source('salt_ceph_states', STATE_PATH)
+    states.__opts__ = opts
+    states.__salt__ = fake_salt(opts)
+    states.__context__ = {}
+    for name in public_functions(module):
+        states.__salt__['ceph_cfg.' + name] = getattr(module, name)
+    return module, states
+
+
+def public_functions(module):
+    '''
+    List the functions salt exposes from a module
+    '''
+    return sorted(
+        name for name, value in vars(module).items()
+        if callable(value) and not name.startswith('_') and
+        getattr(value, '__module__', None) == module.__name__)
+
+
+def module_cases(module, disks, cachedir):
+    '''
+    Arguments to call each execution module function with
+    '''
+    devs = ['/dev/vd{0}'.format(chr(ord('b') + index)) for index in range(disks)]
+    cluster = {'cluster_name': 'ceph'}
+    mon = {'mon_name': 'mon00', 'cluster_name': 'ceph'}
+    handle = module.job_start('osd_prepare', osd_dev=devs[0])
+    module.job_wait(handle, interval=0.01)
+    cases = {
+        'partition_list': ((), {}),
+        'partition_list_osd': ((), {}),
+        'partition_list_journal': ((), {}),
+        'osd_discover': ((), {}),
+        'partition_is': ((devs[0],), {}),
+        'partition_is_many': ((), {'devs': devs}),
+        'partition_inventory_refresh': ((), {}),
+        'disk_inventory': ((), {}),
+        'osd_layout_suggest': ((), {}),
+        'zap': ((), {'dev': devs[0]}),
+        'zap_many': ((), {'devs': devs}),
+        'osd_prepare': ((), {'osd_dev': devs[0]}),
+        'osd_activate': ((), {'osd_dev': devs[0]}),
+        'osd_prepare_many': ((), {'devices': devs}),
+        'osd_activate_many': ((), {'devices': devs}),
+        'osd_dev_status': ((), {'devs': devs}),
+        'osd_activate_all': ((), {'timeout': 60, 'interval': 0.01}),
+        'osd_reweight': ((), dict(cluster, osd_number=0, weight=0.5)),
+        'osd_reweight_many': ((), dict(cluster, weights=dict((index, 0.5) for index in range(disks)))),
+        'osd_drain': ((), dict(cluster, osd_numbers=list(range(disks)), step=0.25, interval=0.01)),
+        'keyring_bundle_apply': ((), cluster),
+        'mon_is': ((), mon),
+        'mon_status': ((), mon),
+        'mon_quorum': ((), mon),
+        'mon_active': ((), mon),
+        'mon_create': ((), mon),
+        'mon_destroy': ((), {'mon_name': 'mon99', 'cluster_name': 'ceph'}),
+        'mon_list': ((), cluster),
+        'rgw_pools_create': ((), cluster),
+        'rgw_pools_missing': ((), cluster),
+        'rgw_create': ((), dict(cluster, name='rgw.bench')),
+        'rgw_destroy': ((), dict(cluster, name='rgw.bench')),
+        'mds_create': ((), dict(cluster, name='mds.bench', port=1000, addr='127.0.0.1')),
+        'mds_destroy': ((), dict(cluster, name='mds.bench')),
+        'keyring_auth_list': ((), cluster),
+        'keyring_auth_get': (('client.bootstrap-osd',), cluster),
+        'keyring_auth_has_many': ((), dict(cluster, entities=['client.bootstrap-osd', 'client.bootstrap-rgw'])),
+        'pool_list': ((), cluster),
+        'pool_add': (('bench',), cluster),
+        'pool_del': (('bench',), cluster),
+        'pool_add_many': ((), dict(cluster, pools=['bench{0}'.format(index) for index in range(disks)])),
+        'pool_del_many': ((), dict(cluster, pool_names=['bench{0}'.format(index) for index in range(disks)])),
+        'pool_apply': ((), dict(cluster, pools=['rbd'] + ['bench{0}'.format(index) for index in range(disks)])),
+        'purge': ((), cluster),
+        'ceph_version': ((), {}),
+        'config_get': ((), dict(cluster, key='fsid')),
+        'cluster_quorum': ((), cluster),
+        'wait_for_quorum': ((), dict(cluster, timeout=1)),
+        'cluster_status': ((), cluster),
+        'mine_status': ((), dict(mon)),
+        'cephfs_list': ((), cluster),
+        'cephfs_add': (('bench',), dict(cluster, pool_data='data', pool_metadata='metadata')),
+        'cephfs_del': (('bench',), cluster),
+        'cluster_reconcile': ((), dict(cluster, desired={
+            'mons': ['mon00'],
+            'keyrings': ['osd', 'rgw', 'mds'],
+            'pools': ['rbd', 'data', 'metadata'],
+            'rgw_pools': True,
+            'osds': devs,
+            'cephfs': [{'name': 'bench', 'pool_data': 'data', 'pool_metadata': 'metadata'}]
+        })),
+        'stats': ((), {}),
+        'job_start': (('osd_prepare',), {'osd_dev': devs[0]}),
+        'job_status': ((handle,), {}),
+        'job_wait': ((handle,), {}),
+        'metrics_export': ((), {'path': os.path.join(cachedir, 'ceph_cfg.prom')}),
+    }
+    for action in ('create', 'save', 'purge', 'present', 'auth_add', 'auth_del'):
+        cases['keyring_' + action] = ((), dict(cluster, keyring_type='osd'))
+        for keyring_type in ('admin', 'mon', 'osd', 'rgw', 'mds'):
+            cases['keyring_{0}_{1}'.format(keyring_type, action)] = ((), cluster)
+    return cases
+
+
+def state_cases():
+    '''
+    Arguments to call each state function with
+    '''
+    return {
+        'quorum': (('bench',), {'cluster_name': 'ceph'}),
+        'wait_for_quorum': (('bench',), {'cluster_name': 'ceph', 'timeout': 1}),
+        'keyring_present': (('bench', 'osd'), {'cluster_name': 'ceph'}),
+        'keyring_absent': (('bench', 'rgw'), {'cluster_name': 'ceph'}),
+        'keyring_authorized': (('bench', 'osd'), {'cluster_name': 'ceph'}),
+        'pools_managed': (('bench', ['rbd', 'bench']), {'cluster_name': 'ceph'}),
+        'osd_prepared': (('/dev/vdb',), {'cluster_name': 'ceph'}),
+        'osd_active': (('/dev/vdb',), {}),
+        'osds_managed': (('bench', ['/dev/vdb', '/dev/vdc']), {'cluster_name': 'ceph'}),
+    }
+
+
+def measure(func, args, kwargs, iterations):
+    '''
+    Call a function repeatedly and collect its latencies
+    '''
+    durations = []
+    errors = 0
+    for _ in range(iterations):
+        start = time.time()
+        try:
+            func(*args, **kwargs)
+        except Exception:  # pylint: disable=broad-except
+            errors += 1
+        durations.append(time.time() - start)
+    durations.sort()
+    total = sum(durations)
+    return {
+        'iterations': iterations,
+        'errors': errors,
+        'ops_per_sec': iterations / total if total else float('inf'),
+        'p50_ms': durations[int(0.50 * (len(durations) - 1))] * 1000,
+        'p99_ms': durations[int(0.99 * (len(durations) - 1))] * 1000
+    }
+
+
+def run(args):
+    '''
+    Run all selected benchmarks
+    '''
+    fake.configure(latency=args.latency)
+    cachedir = tempfile.mkdtemp(prefix='bench_ceph_cfg')
+    try:
+        module, states = load_modules(cachedir, use_rados=args.rados)
+        suites = [('ceph_cfg', module, module_cases(module, args.disks, cachedir)), ('ceph', states, state_cases())]
+        missing = []
+        for prefix, target, cases in suites:
+            missing.extend('{0}.{1}'.format(prefix, name) for name in public_functions(target) if name not in cases)
+        if missing:
+            raise SystemExit("No benchmark case for:{0}".format(', '.join(missing)))
+        pattern = re.compile(args.filter)
+        results = {}
+        for prefix, target, cases in suites:
+            for name in public_functions(target):
+                label = '{0}.{1}'.format(prefix, name)
+                if not pattern.search(label):
+                    continue
+                fake.reset(disks=args.disks, osds=args.disks)
+                for keyring_type in ('admin', 'mon', 'osd', 'rgw', 'mds'):
+                    module.keyring_save(keyring_type=keyring_type)
+                module.keyring_auth_add(keyring_type='osd')
+                call_args, call_kwargs = cases[name]
+                results[label] = measure(getattr(target, name), call_args, call_kwargs, args.iterations)
+    finally:
+        shutil.rmtree(cachedir, ignore_errors=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--latency', type=float, default=0.001,
+                        help='simulated library latency per call in seconds')
+    parser.add_argument('--iterations', type=int, default=20,
+                        help='calls per function')
+    parser.add_argument('--disks', type=int, default=24,
+                        help='number of simulated data disks')
+    parser.add_argument('--filter', default='',
+                        help='only run functions matching this regular expression')
+    parser.add_argument('--no-rados', dest='rados', action='store_false',
+                        help='run monitor commands through the ceph command line')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+    results = run(args)
+    print('{0:<40} {1:>10} {2:>10} {3:>10} {4:>7}'.format('function', 'ops/sec', 'p50 ms', 'p99 ms', 'errors'))
+    for label in sorted(results):
+        result = results[label]
+        print('{0:<40} {1:>10.1f} {2:>10.3f} {3:>10.3f} {4:>7}'.format(
+            label, result['ops_per_sec'], result['p50_ms'], result['p99_ms'], result['errors']))
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump(results, json_file, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
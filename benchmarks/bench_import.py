@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Benchmark loading the ceph_cfg execution module.
+
+Each sample runs in a fresh interpreter which imports the module and calls
+__virtual__, as the salt loader does. The lazy mode is the module as
+shipped, the eager mode also imports the ceph_cfg library as the module
+did before the library import was deferred to the first function call.
+
+The stand-in library in benchmarks/fake is used. Set
+FAKE_CEPH_CFG_IMPORT_DELAY to model the import cost of the real library.
+
+Example:
+
+    FAKE_CEPH_CFG_IMPORT_DELAY=0.05 python benchmarks/bench_import.py --samples 20
+'''
+from __future__ import absolute_import, print_function
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+MODULE_PATH = os.path.join(os.path.dirname(BENCH_DIR), '_modules', 'ceph_cfg', '__init__.py')
+
+
+def load_source(name, path):
+    '''
+    Import a python file as a module
+    '''
+    try:
+        import importlib.util
+    except ImportError:
+        import imp
+        return imp.load_source(name, path)
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def child(eager):
+    '''
+    Time loading the module in this interpreter
+    '''
+    sys.path.insert(0, os.path.join(BENCH_DIR, 'fake'))
+    # Salt and the standard library are already imported by a minion when
+    # modules are loaded.
+    import salt.exceptions  # pylint: disable=unused-variable
+    import multiprocessing.pool  # pylint: disable=unused-variable
+    start = time.time()
+    module = load_source('salt_ceph_cfg', MODULE_PATH)
+    loaded = module.__virtual__()
+    if eager:
+        import ceph_cfg  # pylint: disable=unused-variable
+    duration = time.time() - start
+    if loaded is not True and loaded != 'ceph_cfg':
+        raise SystemExit("module did not load:{0}".format(loaded))
+    print(duration)
+
+
+def sample(eager, samples):
+    '''
+    Load the module in fresh interpreters and collect the durations
+    '''
+    command = [sys.executable, os.path.abspath(__file__), '--child']
+    if eager:
+        command.append('--eager')
+    durations = []
+    for _ in range(samples):
+        output = subprocess.check_output(command)
+        durations.append(float(output.decode('utf-8').strip().splitlines()[-1]))
+    durations.sort()
+    return durations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--samples', type=int, default=10, help='interpreters to start per mode')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--eager', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.eager)
+        return
+    print('{0:<8} {1:>10} {2:>10} {3:>10}'.format('mode', 'mean ms', 'p50 ms', 'max ms'))
+    for mode, eager in (('lazy', False), ('eager', True)):
+        durations = sample(eager, args.samples)
+        print('{0:<8} {1:>10.3f} {2:>10.3f} {3:>10.3f}'.format(
+            mode,
+            sum(durations) / len(durations) * 1000,
+            durations[len(durations) // 2] * 1000,
+            durations[-1] * 1000))
+
+
+if __name__ == '__main__':
+    main()
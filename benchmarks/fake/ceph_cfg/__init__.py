@@ -0,0 +1,459 @@
+# -*- coding: utf-8 -*-
+'''
+Stand-in for the ceph_cfg library used to benchmark the salt module.
+
+Simulates the disks, mon daemons, keyrings, pools and cephfs of a single
+node cluster in memory. Every call sleeps for a configurable latency to
+model the cost of the real library.
+
+The default latency in seconds is read from the FAKE_CEPH_CFG_LATENCY
+environment variable and can be changed per call with configure(). The
+FAKE_CEPH_CFG_IMPORT_DELAY environment variable sets a delay in seconds
+when this library is imported, to model the import cost of the real
+library.
+'''
+from __future__ import absolute_import
+import copy
+import json
+import os
+import threading
+import time
+import uuid
+
+
+class Error(Exception):
+    '''
+    Error raised by the fake library
+    '''
+
+
+time.sleep(float(os.environ.get('FAKE_CEPH_CFG_IMPORT_DELAY', '0')))
+
+_LOCK = threading.RLock()
+_LATENCY = {'default': float(os.environ.get('FAKE_CEPH_CFG_LATENCY', '0'))}
+_STATE = {}
+_FSID = 'be2a3e75-6190-406f-ab41-435ed5257319'
+_KEYRING_ENTITIES = {
+    'admin': 'client.admin',
+    'mon': 'mon.',
+    'osd': 'client.bootstrap-osd',
+    'rgw': 'client.bootstrap-rgw',
+    'mds': 'client.bootstrap-mds'
+}
+_RGW_POOLS = ['.rgw', '.rgw.control', '.rgw.gc', '.rgw.root', '.users', '.users.uid']
+
+
+def configure(latency=None, latencies=None):
+    '''
+    Set the default latency and per function latencies in seconds
+    '''
+    with _LOCK:
+        if latency is not None:
+            _LATENCY['default'] = float(latency)
+        for name, value in (latencies or {}).items():
+            _LATENCY[name] = float(value)
+
+
+def reset(disks=24, journals=0, mons=1, osds=0):
+    '''
+    Reset the simulated node
+
+    Creates rotational data disks /dev/vdb onwards, followed by
+    non rotational journal disks, mon daemons in quorum, and OSDs of
+    other nodes in the osd map.
+    '''
+    names = ['vd{0}'.format(chr(ord('b') + index)) for index in range(disks + journals)]
+    with _LOCK:
+        _STATE.clear()
+        _STATE['disks'] = dict(('/dev/' + name, {
+            'partitions': {},
+            'rotational': index < disks
+        }) for index, name in enumerate(names))
+        _STATE['mons'] = dict(('mon{0:02d}'.format(index), {'active': True}) for index in range(mons))
+        _STATE['keyrings'] = {}
+        _STATE['auth'] = {}
+        _STATE['pools'] = {'rbd': {'pg_num': 64}}
+        _STATE['cephfs'] = {}
+        _STATE['rgw'] = set()
+        _STATE['mds'] = set()
+        _STATE['weights'] = dict((osd_number, 1.0) for osd_number in range(osds))
+        _STATE['next_osd'] = osds
+
+
+def _delay(name):
+    '''
+    Sleep for the latency of a function
+    '''
+    latency = _LATENCY.get(name, _LATENCY['default'])
+    if latency > 0:
+        time.sleep(latency)
+
+
+def _call(func):
+    '''
+    Decorator adding latency and locking to a fake library function
+    '''
+    def wrapper(*args, **kwargs):
+        _delay(func.__name__)
+        with _LOCK:
+            return copy.deepcopy(func(*args, **kwargs))
+    wrapper.__name__ = func.__name__
+    wrapper.__doc__ = func.__doc__
+    return wrapper
+
+
+def _disk(dev):
+    if dev not in _STATE['disks']:
+        raise Error("Not a block device:{0}".format(dev))
+    return _STATE['disks'][dev]
+
+
+def _osd_partitions(role):
+    output = {}
+    for dev, disk in _STATE['disks'].items():
+        for part, info in disk['partitions'].items():
+            if info['role'] == role:
+                output[part] = dict(info, dev_parent=dev)
+    return output
+
+
+def _keyring(keyring_type):
+    if keyring_type not in _KEYRING_ENTITIES:
+        raise Error("Invalid keyring_type:{0}".format(keyring_type))
+    return keyring_type
+
+
+def _secret():
+    return uuid.uuid4().hex[:38] + '=='
+
+
+@_call
+def partition_list():
+    return dict((dev, sorted(disk['partitions'])) for dev, disk in _STATE['disks'].items())
+
+
+@_call
+def partition_list_osd():
+    return _osd_partitions('osd')
+
+
+@_call
+def partition_list_journal():
+    return _osd_partitions('journal')
+
+
+@_call
+def osd_discover():
+    output = {}
+    for part, info in _osd_partitions('osd').items():
+        output.setdefault(_FSID, []).append({
+            'dev': part,
+            'dev_journal': info['journal'],
+            'dev_parent': info['dev_parent'],
+            'fsid': info['osd_uuid'],
+            'whoami': info['whoami'],
+            'magic': 'ceph osd volume v026'
+        })
+    return output
+
+
+@_call
+def partition_is(dev):
+    for disk in _STATE['disks'].values():
+        if dev in disk['partitions']:
+            return True
+    _disk(dev)
+    return False
+
+
+@_call
+def zap(dev=None, **kwargs):
+    _disk(dev)['partitions'] = {}
+    return True
+
+
+@_call
+def osd_prepare(osd_dev=None, journal_dev=None, osd_uuid=None, **kwargs):
+    disk = _disk(osd_dev)
+    if disk['partitions']:
+        return True
+    journal_disk = _disk(journal_dev or osd_dev)
+    data_part = '{0}1'.format(osd_dev)
+    journal_part = '{0}{1}'.format(journal_dev or osd_dev, len(journal_disk['partitions']) + 2)
+    journal_disk['partitions'][journal_part] = {'role': 'journal'}
+    disk['partitions'][data_part] = {
+        'role': 'osd',
+        'journal': journal_part,
+        'osd_uuid': osd_uuid or str(uuid.uuid4()),
+        'whoami': None
+    }
+    return True
+
+
+@_call
+def osd_activate(osd_dev=None, **kwargs):
+    for part, info in _disk(osd_dev)['partitions'].items():
+        if info['role'] == 'osd' and info['whoami'] is None:
+            info['whoami'] = _STATE['next_osd']
+            _STATE['weights'][_STATE['next_osd']] = 1.0
+            _STATE['next_osd'] += 1
+    return True
+
+
+@_call
+def osd_reweight(osd_number=None, weight=None, **kwargs):
+    _STATE['weights'][int(osd_number)] = float(weight)
+    return True
+
+
+@_call
+def keyring_create(keyring_type=None, **kwargs):
+    keyring_type = _keyring(keyring_type)
+    secret = _STATE['keyrings'].get(keyring_type) or _secret()
+    return '[{0}]\n\tkey = {1}\n'.format(_KEYRING_ENTITIES[keyring_type], secret)
+
+
+@_call
+def keyring_save(keyring_type=None, secret=None, key_content=None, **kwargs):
+    keyring_type = _keyring(keyring_type)
+    if keyring_type in _STATE['keyrings']:
+        return True
+    if secret is None and key_content is not None:
+        secret = key_content.split('key = ')[-1].split()[0]
+    _STATE['keyrings'][keyring_type] = secret or _secret()
+    return True
+
+
+@_call
+def keyring_purge(keyring_type=None, **kwargs):
+    _STATE['keyrings'].pop(_keyring(keyring_type), None)
+    return True
+
+
+@_call
+def keyring_present(keyring_type=None, **kwargs):
+    return _keyring(keyring_type) in _STATE['keyrings']
+
+
+@_call
+def keyring_auth_add(keyring_type=None, **kwargs):
+    keyring_type = _keyring(keyring_type)
+    if keyring_type not in _STATE['keyrings']:
+        raise Error("Keyring not saved:{0}".format(keyring_type))
+    _STATE['auth'][_KEYRING_ENTITIES[keyring_type]] = {
+        'key': _STATE['keyrings'][keyring_type],
+        'caps': {'mon': 'allow profile bootstrap-{0}'.format(keyring_type)}
+    }
+    return True
+
+
+@_call
+def keyring_auth_del(keyring_type=None, **kwargs):
+    _STATE['auth'].pop(_KEYRING_ENTITIES[_keyring(keyring_type)], None)
+    return True
+
+
+@_call
+def keyring_auth_list(**kwargs):
+    return {'auth_dump': [dict(entry, entity=entity) for entity, entry in sorted(_STATE['auth'].items())]}
+
+
+@_call
+def mon_is(mon_name=None, **kwargs):
+    return mon_name in _STATE['mons']
+
+
+@_call
+def mon_status(mon_name=None, **kwargs):
+    names = sorted(_STATE['mons'])
+    return {
+        'name': mon_name,
+        'state': 'leader' if names and mon_name == names[0] else 'peon',
+        'quorum': list(range(len(names))),
+        'monmap': {'fsid': _FSID, 'mons': [{'name': name} for name in names]}
+    }
+
+
+@_call
+def mon_quorum(mon_name=None, **kwargs):
+    return mon_name in _STATE['mons']
+
+
+@_call
+def mon_active(mon_name=None, **kwargs):
+    return _STATE['mons'].get(mon_name, {}).get('active', False)
+
+
+@_call
+def mon_create(mon_name=None, **kwargs):
+    _STATE['mons'][mon_name] = {'active': True}
+    return True
+
+
+@_call
+def mon_destroy(mon_name=None, **kwargs):
+    _STATE['mons'].pop(mon_name, None)
+    return True
+
+
+@_call
+def mon_list(**kwargs):
+    return sorted(_STATE['mons'])
+
+
+@_call
+def rgw_pools_create(**kwargs):
+    for pool in _RGW_POOLS:
+        _STATE['pools'].setdefault(pool, {'pg_num': 8})
+    return True
+
+
+@_call
+def rgw_pools_missing(**kwargs):
+    return [pool for pool in _RGW_POOLS if pool not in _STATE['pools']]
+
+
+@_call
+def rgw_create(name=None, **kwargs):
+    _STATE['rgw'].add(name)
+    return True
+
+
+@_call
+def rgw_destroy(name=None, **kwargs):
+    _STATE['rgw'].discard(name)
+    return True
+
+
+@_call
+def mds_create(name=None, port=None, addr=None, **kwargs):
+    _STATE['mds'].add(name)
+    return True
+
+
+@_call
+def mds_destroy(name=None, **kwargs):
+    _STATE['mds'].discard(name)
+    return True
+
+
+@_call
+def pool_list(**kwargs):
+    return [{'poolnum': index, 'poolname': name} for index, name in enumerate(sorted(_STATE['pools']))]
+
+
+@_call
+def pool_add(pool_name, pg_num=8, **kwargs):
+    _STATE['pools'].setdefault(pool_name, {'pg_num': int(pg_num)})
+    return True
+
+
+@_call
+def pool_del(pool_name, **kwargs):
+    _STATE['pools'].pop(pool_name, None)
+    return True
+
+
+@_call
+def purge(**kwargs):
+    _STATE['mons'].clear()
+    _STATE['keyrings'].clear()
+    return True
+
+
+@_call
+def ceph_version():
+    return '10.2.0'
+
+
+@_call
+def cluster_quorum(**kwargs):
+    return bool(_STATE['mons'])
+
+
+@_call
+def cluster_status(**kwargs):
+    return {
+        'fsid': _FSID,
+        'health': {'overall_status': 'HEALTH_OK' if _STATE['mons'] else 'HEALTH_ERR'},
+        'quorum_names': sorted(_STATE['mons']),
+        'pgmap': {'num_pgs': sum(pool['pg_num'] for pool in _STATE['pools'].values())}
+    }
+
+
+@_call
+def cephfs_ls(**kwargs):
+    return [dict(info, name=name) for name, info in sorted(_STATE['cephfs'].items())]
+
+
+@_call
+def cephfs_add(fs_name, pool_data=None, pool_metadata=None, **kwargs):
+    _STATE['cephfs'][fs_name] = {'data_pools': [pool_data], 'metadata_pool': pool_metadata}
+    return True
+
+
+@_call
+def cephfs_del(fs_name, **kwargs):
+    _STATE['cephfs'].pop(fs_name, None)
+    return True
+
+
+reset()
+
+
+def _mon_osd_dump():
+    return {
+        'osds': [
+            {'osd': osd_number, 'weight': weight, 'up': 1, 'in': 1 if weight > 0 else 0}
+            for osd_number, weight in sorted(_STATE['weights'].items())]
+    }
+
+
+def _mon_osd_reweightn(weights):
+    for osd_number, weight in json.loads(weights).items():
+        _STATE['weights'][int(osd_number)] = weight / float(0x10000)
+    return None
+
+
+def _mon_quorum_status():
+    return {'quorum_names': sorted(_STATE['mons'])}
+
+
+# Monitor commands by prefix, with their argument names and handler.
+MON_COMMANDS = {
+    'osd dump': ([], _mon_osd_dump),
+    'osd reweightn': (['weights'], _mon_osd_reweightn),
+    'quorum_status': ([], _mon_quorum_status)
+}
+
+
+@_call
+def mon_command(command=None, target=None):
+    '''
+    Models monitor commands, not a library function
+
+    Takes the command as a dictionary and returns the return code, the
+    output and the error message as the monitors do.
+    '''
+    command = dict(command, target=target)
+    if command['prefix'] not in MON_COMMANDS:
+        return -22, b'', 'unknown command {0}'.format(command['prefix'])
+    arg_names, handler = MON_COMMANDS[command['prefix']]
+    output = handler(*[command.get(arg_name) for arg_name in arg_names])
+    return 0, json.dumps(output).encode('utf-8') if output is not None else b'', ''
+
+
+def mon_command_argv(argv):
+    '''
+    Convert "ceph" command line arguments to a monitor command dictionary
+    '''
+    words = [word for word in argv[1:] if word not in ('--format', 'json')]
+    if words[:1] == ['--cluster']:
+        words = words[2:]
+    for prefix, (arg_names, _) in MON_COMMANDS.items():
+        prefix_words = prefix.split()
+        if words[:len(prefix_words)] == prefix_words and len(words) == len(prefix_words) + len(arg_names):
+            command = dict(zip(arg_names, words[len(prefix_words):]))
+            command['prefix'] = prefix
+            return command
+    return {'prefix': ' '.join(words)}
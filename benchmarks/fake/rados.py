@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+'''
+Stand-in for python-rados used to benchmark the salt module.
+
+Monitor commands act on the state of the fake ceph_cfg library. Connecting
+sleeps for the FAKE_RADOS_CONNECT_DELAY environment variable in seconds,
+to model the cost of connecting to the monitors, and every monitor command
+sleeps for the latency of the fake library.
+'''
+from __future__ import absolute_import
+import json
+import os
+import time
+
+import ceph_cfg
+
+
+class Error(Exception):
+    '''
+    Error raised by the fake library
+    '''
+
+
+_CONNECT_DELAY = float(os.environ.get('FAKE_RADOS_CONNECT_DELAY', '0.01'))
+
+
+class Rados(object):
+    '''
+    Fake cluster handle
+    '''
+    def __init__(self, clustername='ceph', conffile=None, name=None):
+        self.clustername = clustername
+        self.state = 'configuring'
+
+    def connect(self, timeout=0):
+        time.sleep(_CONNECT_DELAY)
+        self.state = 'connected'
+
+    def get_fsid(self):
+        return ceph_cfg._FSID  # pylint: disable=protected-access
+
+    def mon_command(self, cmd, inbuf, timeout=0, target=None):
+        if self.state != 'connected':
+            raise Error('not connected')
+        return ceph_cfg.mon_command(json.loads(cmd), target)
+
+    def shutdown(self):
+        self.state = 'shutdown'